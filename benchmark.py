@@ -0,0 +1,654 @@
+"""Load test for the ticket lifecycle against every storage backend.
+
+Drives the real :class:`ticket.TicketBot` cog through an in-process fake of
+the Discord guild and interaction layer. Every simulated API call waits a
+configurable latency and is checked against per-route rate limits, which
+answer like Discord does: wait ``retry_after`` and try again.
+
+Each backend runs against a local stand-in: in-memory SQLite, mongomock
+for MongoDB, and for MySQL any MySQL-compatible server given with
+``--mysql-host`` (a throwaway MariaDB container works well). There is no
+in-process stand-in for MySQL, so without a server that backend is
+reported as skipped. Three phases are measured per backend:
+
+- create: N users press the ticket button concurrently
+- close:  every ticket that was opened is closed with /close, including
+          archiving its transcript of ``--messages`` messages
+- load:   /load recreates channels for M stored tickets
+
+Usage::
+
+    python benchmark.py --users 200 --latency 0.05 --output results.json
+    python benchmark.py --baseline results.json   # exits 1 on a regression
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import itertools
+import shutil
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from collections import Counter
+
+# Keep a local .env from starting the metrics endpoint or picking the backend
+os.environ["METRICS_PORT"] = ""
+
+import nextcord
+import metrics
+import ticket
+
+BACKENDS = ("sqlite", "mongodb", "mysql")
+
+# route -> (calls, per seconds), per guild or channel like Discord's buckets
+DEFAULT_LIMITS = {
+    "create_channel": (50, 10.0),
+    "create_category": (5, 10.0),
+    "edit_channel": (2, 600.0),
+    "delete_channel": (50, 10.0),
+    "send_message": (5, 5.0),
+    "fetch_user": (50, 1.0)
+}
+
+
+# --------------------------------------------------------------------------- #
+# Fake Discord
+# --------------------------------------------------------------------------- #
+
+class FakeDiscord:
+    """Simulated Discord API: latency, per-route rate limits and call counts."""
+
+    def __init__(self, latency: float, jitter: float, limits: dict, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.limits = limits
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.ratelimited = Counter()
+        self._windows = {}
+        self._ids = itertools.count(10 ** 17)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def _retry_after(self, route: str, major_id) -> float:
+        limit = self.limits.get(route)
+        if limit is None:
+            return 0.0
+        calls, per = limit
+        now = time.monotonic()
+        window = self._windows.get((route, major_id))
+        if window is None or now >= window[0]:
+            window = self._windows[(route, major_id)] = [now + per, calls]
+        if window[1] > 0:
+            window[1] -= 1
+            return 0.0
+        return window[0] - now
+
+    async def request(self, route: str, major_id=None):
+        self.calls[route] += 1
+        while True:
+            await asyncio.sleep(self._delay())
+            retry_after = self._retry_after(route, major_id)
+            if retry_after <= 0:
+                return
+            # A 429: nextcord sleeps for retry_after and sends the request again
+            self.ratelimited[route] += 1
+            await asyncio.sleep(retry_after)
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.mention = f"<@{user_id}>"
+
+
+class FakeRole:
+    def __init__(self, role_id: int):
+        self.id = role_id
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, author: FakeUser, content: str):
+        self.id = message_id
+        self.author = author
+        self.content = content
+        self.created_at = datetime.now(timezone.utc)
+        self.edited_at = None
+        self.attachments = []
+        self.embeds = []
+
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id: int, name: str, category=None, topic=None, overwrites=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category = category
+        self.topic = topic
+        self.overwrites = overwrites or {}
+        self.mention = f"<#{channel_id}>"
+        self.messages = []
+
+    def add_message(self, author: FakeUser, content: str):
+        """Add a message without an API call, as if a user had sent it."""
+        self.messages.append(FakeMessage(self.guild.api.next_id(), author, content))
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.api.request("send_message", self.id)
+        self.add_message(self.guild.me, content)
+
+    async def history(self, limit: int = 100, after=None, oldest_first: bool = False):
+        await self.guild.api.request("read_history", self.id)
+        messages = [message for message in self.messages if after is None or message.id > after.id]
+        messages = messages[:limit] if oldest_first or after is not None else messages[::-1][:limit]
+        for message in messages:
+            yield message
+
+    async def edit(self, **fields):
+        await self.guild.api.request("edit_channel", self.id)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    async def set_permissions(self, target, **permissions):
+        await self.guild.api.request("edit_permissions", self.id)
+
+    async def delete(self):
+        await self.guild.api.request("delete_channel", self.id)
+        self.guild.channels.pop(self.id, None)
+        # The gateway event that follows a deletion
+        if self.guild.on_channel_delete is not None:
+            await self.guild.on_channel_delete(self)
+
+
+class FakeCategory(FakeTextChannel):
+    @property
+    def text_channels(self) -> list:
+        return [channel for channel in self.guild.text_channels if channel.category is self]
+
+
+class FakeGuild:
+    def __init__(self, api: FakeDiscord, guild_id: int, me: FakeUser):
+        self.api = api
+        self.id = guild_id
+        self.me = me
+        self.default_role = FakeRole(guild_id)
+        self.channels = {}
+        self.on_channel_delete = None
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    @property
+    def text_channels(self) -> list:
+        return [channel for channel in self.channels.values() if not isinstance(channel, FakeCategory)]
+
+    async def create_category(self, name: str, **kwargs):
+        await self.api.request("create_category", self.id)
+        category = FakeCategory(self, self.api.next_id(), name)
+        self.channels[category.id] = category
+        return category
+
+    async def create_text_channel(self, name: str, overwrites=None, category=None, topic=None, **kwargs):
+        await self.api.request("create_channel", self.id)
+        channel = FakeTextChannel(self, self.api.next_id(), name, category, topic, overwrites)
+        self.channels[channel.id] = channel
+        return channel
+
+
+class FakeHTTP:
+    async def request(self, route, **kwargs):
+        raise RuntimeError("The benchmark talks to FakeDiscord, not the HTTP client")
+
+
+class FakeBot:
+    def __init__(self, api: FakeDiscord):
+        self.api = api
+        self.user = FakeUser(api.next_id(), "ticketbot")
+        self.http = FakeHTTP()
+        self.guilds = []
+        self.users = {}
+        self.views = {}
+        self.loop = asyncio.get_running_loop()
+
+    def add_view(self, view, message_id=None):
+        for item in view.children:
+            self.views[item.custom_id] = item
+
+    async def press(self, interaction):
+        """Dispatch a button press to the persistent view item registered for its custom ID, as nextcord does."""
+        await self.views[interaction.data["custom_id"]].callback(interaction)
+
+    def get_guild(self, guild_id: int):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def get_user(self, user_id: int):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id: int):
+        await self.api.request("fetch_user")
+        user = self.users.get(user_id)
+        if user is None:
+            raise nextcord.NotFound(FakeNotFound(), "Unknown User")
+        return user
+
+
+class FakeNotFound:
+    status = 404
+    reason = "Not Found"
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.responded_at = None
+
+    async def _respond(self):
+        if self.responded_at is not None:
+            raise RuntimeError("This interaction has already been responded to")
+        await self.interaction.guild.api.request("interaction_response")
+        self.responded_at = time.perf_counter()
+
+    async def send_message(self, content=None, **kwargs):
+        self.interaction.messages.append(content)
+        await self._respond()
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    def is_done(self) -> bool:
+        return self.responded_at is not None
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self.interaction.messages.append(content)
+        await self.interaction.guild.api.request("followup")
+
+
+class FakeInteraction:
+    _ids = itertools.count(1)
+
+    def __init__(self, guild: FakeGuild, user: FakeUser, channel=None, custom_id: str = None):
+        self.id = next(self._ids)
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.application_command = None
+        self.messages = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        if custom_id is not None:
+            self.type = nextcord.InteractionType.component
+            self.data = {"custom_id": custom_id}
+        else:
+            self.type = nextcord.InteractionType.application_command
+            self.data = {}
+
+    async def edit_original_message(self, content=None, **kwargs):
+        self.messages.append(content)
+        await self.guild.api.request("edit_original_message")
+
+
+async def invoke(cog, command, interaction: FakeInteraction, *args):
+    """Run a slash command with the cog's invoke hooks and error listener, as nextcord does."""
+    interaction.application_command = command
+    await cog.cog_application_command_check(interaction)
+    await cog.cog_application_command_before_invoke(interaction)
+    try:
+        await command(interaction, *args)
+    except Exception as e:
+        await cog.on_application_command_error(interaction, e)
+        raise
+    finally:
+        await cog.cog_application_command_after_invoke(interaction)
+
+
+# --------------------------------------------------------------------------- #
+# Measurement
+# --------------------------------------------------------------------------- #
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def db_operation_counts(backend: str) -> Counter:
+    counts = Counter()
+    for (series_backend, operation), count in metrics.DB_SECONDS.counts().items():
+        if series_backend == backend:
+            counts[operation] += count
+    return counts
+
+
+class Phase:
+    """Latencies, errors, DB operations and API calls for one benchmark phase."""
+
+    def __init__(self, name: str, backend: str, api: FakeDiscord):
+        self.name = name
+        self.backend = backend
+        self.api = api
+        self.latencies = []
+        self.errors = []
+        self.tickets = 0
+
+    def __enter__(self):
+        self._db_ops = db_operation_counts(self.backend)
+        self._calls = Counter(self.api.calls)
+        self._ratelimited = Counter(self.api.ratelimited)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._started
+        self.db_ops = db_operation_counts(self.backend) - self._db_ops
+        self.api_calls = Counter(self.api.calls) - self._calls
+        self.ratelimited = Counter(self.api.ratelimited) - self._ratelimited
+
+    async def measure(self, coroutine):
+        start = time.perf_counter()
+        try:
+            await coroutine
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+        self.latencies.append(time.perf_counter() - start)
+
+    def result(self) -> dict:
+        db_ops = sum(self.db_ops.values())
+        return {
+            "operations": len(self.latencies),
+            "tickets": self.tickets,
+            "errors": len(self.errors),
+            "first_errors": self.errors[:5],
+            "seconds": round(self.elapsed, 4),
+            "tickets_per_second": round(self.tickets / self.elapsed, 2) if self.elapsed else 0.0,
+            "latency_seconds": {
+                "p50": round(percentile(self.latencies, 0.50), 5),
+                "p95": round(percentile(self.latencies, 0.95), 5),
+                "p99": round(percentile(self.latencies, 0.99), 5),
+                "max": round(max(self.latencies, default=0.0), 5)
+            },
+            "db_ops": db_ops,
+            "db_ops_per_ticket": round(db_ops / self.tickets, 2) if self.tickets else 0.0,
+            "db_ops_by_operation": dict(self.db_ops),
+            "api_calls": dict(self.api_calls),
+            "rate_limited": dict(self.ratelimited)
+        }
+
+
+# --------------------------------------------------------------------------- #
+# Backends
+# --------------------------------------------------------------------------- #
+
+class BackendUnavailable(Exception):
+    """The local stand-in for a backend isn't available, so the backend is skipped."""
+
+
+def configure_backend(backend: str, args, run_id: str):
+    """Point the DATABASE_* settings at the backend's local stand-in.
+
+    Returns a function that undoes any patching, or raises
+    :class:`BackendUnavailable` if the stand-in can't be used here.
+    """
+    if backend == "sqlite":
+        os.environ.update(DATABASE_TYPE="sqlite", DATABASE_NAME=":memory:")
+        return lambda: None
+
+    if backend == "mongodb":
+        try:
+            import mongomock
+        except ImportError:
+            raise BackendUnavailable("mongomock is not installed")
+        os.environ.update(
+            DATABASE_TYPE="mongodb",
+            MONGODB_CONNECTION_STRING="mongodb://localhost:27017",
+            MONGODB_DATABASE=f"ticketbench_{run_id}"
+        )
+        # The engine looks the client up when its driver is loaded
+        import pymongo
+        original = pymongo.MongoClient
+        pymongo.MongoClient = mongomock.MongoClient
+
+        def restore():
+            pymongo.MongoClient = original
+        return restore
+
+    if backend == "mysql":
+        if not args.mysql_host:
+            raise BackendUnavailable("no MySQL-compatible server configured (use --mysql-host or BENCH_MYSQL_HOST)")
+        os.environ.update(
+            DATABASE_TYPE="mysql",
+            MYSQL_HOST=args.mysql_host,
+            MYSQL_PORT=str(args.mysql_port),
+            MYSQL_USER=args.mysql_user,
+            MYSQL_PASSWORD=args.mysql_password,
+            MYSQL_DATABASE=args.mysql_database
+        )
+        return lambda: None
+
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+async def run_backend(backend: str, args, limits: dict) -> dict:
+    run_id = f"{int(time.time())}_{os.getpid()}"
+    restore = configure_backend(backend, args, run_id)
+    transcript_dir = tempfile.mkdtemp(prefix="ticketbench-")
+    os.environ.update(TICKET_POOL_SIZE=str(args.pool_size), TRANSCRIPT_DIR=transcript_dir,
+                      OUTBOX_PATH=os.path.join(transcript_dir, "outbox.db"))
+    ticket.CLOSE_DELAY = 0
+
+    api = FakeDiscord(args.latency, args.jitter, limits, args.seed)
+    bot = FakeBot(api)
+    guild = FakeGuild(api, api.next_id(), bot.user)
+    bot.guilds.append(guild)
+    cog = ticket.TicketBot(bot)
+    guild.on_channel_delete = cog.on_guild_channel_delete
+    users = [FakeUser(api.next_id(), f"user{index}") for index in range(args.users)]
+    bot.users.update((user.id, user) for user in users)
+
+    try:
+        await cog.on_ready()
+        await cog.wait_until_ready()
+        await cog.get_or_create_ticket_category(guild)
+        if args.pool_size:
+            cog.channel_pool.request_refill(guild)
+            while cog.channel_pool.depth(guild.id) < args.pool_size:
+                await asyncio.sleep(0.01)
+
+        phases = {}
+
+        # Every user presses the ticket button at once, some of them twice
+        with Phase("create", backend, api) as create:
+            presses = []
+            for index, user in enumerate(users):
+                repeat = 2 if index < args.users * args.double_clicks else 1
+                for _ in range(repeat):
+                    interaction = FakeInteraction(guild, user, custom_id="support_ticket")
+                    presses.append(create.measure(bot.press(interaction)))
+            await asyncio.gather(*presses)
+            # Pressing the button returns once the request is journaled
+            await cog.outbox.join()
+        channels = [channel for channel in guild.text_channels if cog.db.ticket_for_channel(channel.id)]
+        create.tickets = len(channels)
+        phases["create"] = create.result()
+
+        for channel in channels:
+            for index in range(args.messages):
+                channel.add_message(users[0], f"Message {index} about this ticket")
+        with Phase("close", backend, api) as close:
+            await asyncio.gather(*(
+                close.measure(invoke(cog, cog.close_ticket, FakeInteraction(guild, users[0], channel)))
+                for channel in channels
+            ))
+            # Closing returns before the transcript is archived and the channel deleted
+            await cog.transcripts.join()
+        close.tickets = len(channels) - sum(1 for channel in channels if channel.id in guild.channels)
+        phases["close"] = close.result()
+
+        # Stored tickets whose channels have to be recreated by /load
+        for index in range(args.load_tickets):
+            await cog.db.create_ticket(users[index % len(users)].id, guild.id)
+        with Phase("load", backend, api) as load:
+            await load.measure(invoke(cog, cog.load_tickets, FakeInteraction(guild, users[0])))
+        load.tickets = cog.restore_jobs[guild.id].created if guild.id in cog.restore_jobs else 0
+        phases["load"] = load.result()
+
+        return phases
+    finally:
+        cog.cog_unload()
+        await cog.wait_closed()
+        background = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*background, return_exceptions=True)
+        shutil.rmtree(transcript_dir, ignore_errors=True)
+        restore()
+
+
+# --------------------------------------------------------------------------- #
+# Reporting
+# --------------------------------------------------------------------------- #
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(results: dict):
+    print(f"{'backend':<8} {'phase':<6} {'ops':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'tickets/s':>10} {'db ops/ticket':>14} {'429s':>5}")
+    for backend, phases in results["backends"].items():
+        if "skipped" in phases:
+            print(f"{backend:<8} skipped: {phases['skipped']}")
+            continue
+        for name, phase in phases.items():
+            latency = phase["latency_seconds"]
+            print(f"{backend:<8} {name:<6} {phase['operations']:>6} {phase['errors']:>4} "
+                  f"{latency['p50'] * 1000:>8.1f} {latency['p95'] * 1000:>8.1f} {latency['p99'] * 1000:>8.1f} "
+                  f"{phase['tickets_per_second']:>10.1f} {phase['db_ops_per_ticket']:>14.2f} "
+                  f"{sum(phase['rate_limited'].values()):>5}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return a description of every phase that got slower than ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for backend, phases in results["backends"].items():
+        for name, phase in phases.items():
+            before = baseline.get("backends", {}).get(backend, {}).get(name)
+            if not isinstance(phase, dict) or not isinstance(before, dict):
+                continue
+            p95, old_p95 = phase["latency_seconds"]["p95"], before["latency_seconds"]["p95"]
+            if old_p95 and p95 > old_p95 * (1 + tolerance):
+                regressions.append(f"{backend}/{name}: p95 {old_p95 * 1000:.1f}ms -> {p95 * 1000:.1f}ms")
+            rate, old_rate = phase["tickets_per_second"], before["tickets_per_second"]
+            if old_rate and rate < old_rate * (1 - tolerance):
+                regressions.append(f"{backend}/{name}: {old_rate:.1f} -> {rate:.1f} tickets/s")
+            ops, old_ops = phase["db_ops_per_ticket"], before["db_ops_per_ticket"]
+            if old_ops and ops > old_ops * (1 + tolerance):
+                regressions.append(f"{backend}/{name}: {old_ops:.2f} -> {ops:.2f} db ops/ticket")
+    return regressions
+
+
+def parse_limits(overrides: list) -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    for override in overrides:
+        route, _, limit = override.partition("=")
+        if limit.lower() == "none":
+            limits.pop(route, None)
+            continue
+        calls, _, per = limit.partition("/")
+        limits[route] = (int(calls), float(per))
+    return limits
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ticket lifecycle against each storage backend.")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated backends to run")
+    parser.add_argument("--users", type=int, default=100, help="concurrent users pressing the ticket button")
+    parser.add_argument("--double-clicks", type=float, default=0.1, help="fraction of users who press twice")
+    parser.add_argument("--messages", type=int, default=20, help="messages in each ticket's transcript")
+    parser.add_argument("--load-tickets", type=int, default=25, help="stored tickets restored by /load")
+    parser.add_argument("--pool-size", type=int, default=0, help="TICKET_POOL_SIZE for the run")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated Discord API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="random +/- added to every API call")
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="ROUTE=CALLS/PER",
+                        help="override a route's rate limit, or ROUTE=none to lift it")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the latency jitter")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression is reported")
+    parser.add_argument("--mysql-host", default=os.getenv("BENCH_MYSQL_HOST"),
+                        help="MySQL-compatible server for the mysql backend (e.g. a throwaway MariaDB container); "
+                             "there is no in-process stand-in for MySQL, so without one the backend is skipped")
+    parser.add_argument("--mysql-port", type=int, default=int(os.getenv("BENCH_MYSQL_PORT", 3306)))
+    parser.add_argument("--mysql-user", default=os.getenv("BENCH_MYSQL_USER", "root"))
+    parser.add_argument("--mysql-password", default=os.getenv("BENCH_MYSQL_PASSWORD", ""))
+    parser.add_argument("--mysql-database", default=os.getenv("BENCH_MYSQL_DATABASE", "ticketbench"))
+    return parser.parse_args(argv)
+
+
+async def main(argv=None) -> int:
+    args = parse_args(argv)
+    limits = parse_limits(args.rate_limit)
+    results = {
+        "created_at": time.time(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "users": args.users,
+            "double_clicks": args.double_clicks,
+            "messages": args.messages,
+            "load_tickets": args.load_tickets,
+            "pool_size": args.pool_size,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "seed": args.seed,
+            "rate_limits": {route: list(limit) for route, limit in limits.items()}
+        },
+        "backends": {}
+    }
+
+    for backend in args.backends.split(","):
+        try:
+            results["backends"][backend] = await run_backend(backend, args, limits)
+        except BackendUnavailable as e:
+            results["backends"][backend] = {"skipped": str(e)}
+
+    print_report(results)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
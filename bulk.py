@@ -0,0 +1,85 @@
+import time
+import nextcord
+import metrics
+from concurrency import RouteRateLimiter, run_bounded
+
+
+class BulkCloseJob:
+    """Removes the channels of tickets that were closed in bulk.
+
+    The tickets have already been deleted from the database in one
+    statement; this job only deals with Discord. Channels are handled by a
+    bounded pool of workers pacing themselves with a
+    :class:`RouteRateLimiter`. With transcripts enabled each channel is
+    archived before it is deleted, and a channel whose transcript could not
+    be saved is kept.
+    """
+
+    def __init__(self, guild: nextcord.Guild, rate_limiter: RouteRateLimiter, transcripts,
+                 concurrency: int = 5):
+        self.guild = guild
+        self.rate_limiter = rate_limiter
+        self.transcripts = transcripts
+        self.concurrency = concurrency
+
+        self.total = 0
+        self.deleted = 0
+        self.missing = 0
+        self.failed = 0
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def processed(self) -> int:
+        return self.deleted + self.missing + self.failed
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self, tickets: list):
+        """Remove the channel of every ticket in ``tickets`` (dicts with ``id`` and ``channel_id``)."""
+        self.total = len(tickets)
+        self.started_at = time.monotonic()
+        try:
+            await run_bounded(tickets, self._close, self.concurrency)
+        finally:
+            self.finished_at = time.monotonic()
+
+    async def _close(self, ticket: dict):
+        ticket_id = str(ticket["id"])
+        channel = self.guild.get_channel(ticket["channel_id"]) if ticket.get("channel_id") else None
+        if channel is None:
+            self.missing += 1
+            return
+
+        try:
+            if self.transcripts.enabled:
+                await self.transcripts.archive(ticket_id, channel)
+            await self.rate_limiter.acquire("delete_channel", self.guild.id)
+            await channel.delete()
+            self.deleted += 1
+        except Exception as e:
+            self.failed += 1
+            metrics.log(f"Failed to remove the channel of ticket {ticket_id}: {str(e)}", level="error",
+                        guild_id=self.guild.id, channel_id=channel.id)
+            if len(self.errors) < 5:
+                self.errors.append(f"{ticket_id}: {e}")
+
+    def progress(self) -> str:
+        """One-line progress report for the command's response."""
+        return (f"Closing tickets... {self.processed}/{self.total} processed "
+                f"({self.deleted} channels deleted, {self.missing} already gone, {self.failed} failed)")
+
+    def summary(self) -> str:
+        """Final report shown once the job has finished."""
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        lines = [
+            f"Closed {self.total} tickets; channels removed in {elapsed:.1f}s: "
+            f"{self.deleted} deleted, {self.missing} already gone, {self.failed} failed."
+        ]
+        if self.errors:
+            lines.append("First errors (these channels were kept):")
+            lines.extend(f"- {error}" for error in self.errors)
+        return "\n".join(lines)
@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get when a key is absent, so that None can be cached
+MISSING = object()
+
+
+class TTLCache:
+    """A least-recently-used cache whose entries also expire after ``ttl`` seconds.
+
+    Used from the event loop only, so no locking is needed. Hit and miss
+    counters make it easy to check that a hot path is served from memory.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        """Return the cached value for ``key``, or ``default`` if absent or expired."""
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+
+        self.misses += 1
+        return default
+
+    def peek(self, key, default=MISSING):
+        """Like :meth:`get`, but without touching the counters or the LRU order."""
+        entry = self._data.get(key)
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+        return default
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``, evicting the least recently used entry if full."""
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drop ``key`` from the cache if present."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters and current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize
+        }
+
+
+class ChannelIndex:
+    """Two-way map between ticket channel IDs and ticket IDs.
+
+    Ticket IDs are kept as strings so SQL and MongoDB IDs look the same.
+    """
+
+    def __init__(self):
+        self._tickets = {}
+        self._channels = {}
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def add(self, channel_id: int, ticket_id):
+        ticket_id = str(ticket_id)
+        self.discard_ticket(ticket_id)
+        self.discard_channel(channel_id)
+        self._tickets[channel_id] = ticket_id
+        self._channels[ticket_id] = channel_id
+
+    def get(self, channel_id: int):
+        """Return the ticket ID for a channel, or None if it isn't a ticket channel."""
+        return self._tickets.get(channel_id)
+
+    def channel_for(self, ticket_id):
+        """Return the channel ID for a ticket, or None if it has no known channel."""
+        return self._channels.get(str(ticket_id))
+
+    def discard_ticket(self, ticket_id):
+        channel_id = self._channels.pop(str(ticket_id), None)
+        if channel_id is not None:
+            self._tickets.pop(channel_id, None)
+
+    def discard_channel(self, channel_id: int):
+        ticket_id = self._tickets.pop(channel_id, None)
+        if ticket_id is not None:
+            self._channels.pop(ticket_id, None)
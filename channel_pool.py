@@ -0,0 +1,147 @@
+import time
+import asyncio
+from collections import deque
+import nextcord
+import metrics
+from concurrency import RouteRateLimiter
+
+# Name given to pooled channels until a ticket claims them; also used to
+# adopt pooled channels left over from a previous run
+POOL_CHANNEL_NAME = "ticket-pending"
+
+
+class ChannelPool:
+    """Per-guild pool of hidden, pre-created ticket channels.
+
+    Creating a channel is the slowest and most rate-limited step of opening
+    a ticket. With a pool, a button press claims a ready channel and only
+    has to rename it and apply the user's permissions in a single edit. A
+    background task tops the pool back up after every claim.
+    """
+
+    def __init__(self, rate_limiter: RouteRateLimiter, size: int, category_for):
+        self.rate_limiter = rate_limiter
+        self.size = size
+        # Coroutine returning a guild's configured ticket category, or None
+        self.category_for = category_for
+
+        self._channels = {}
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        self.claimed = 0
+        self.misses = 0
+        self.created = 0
+        self._created_at = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def depth(self, guild_id: int = None) -> int:
+        """Number of ready channels for one guild, or for all guilds."""
+        if guild_id is not None:
+            return len(self._channels.get(guild_id, ()))
+        return sum(len(channels) for channels in self._channels.values())
+
+    def refill_rate(self) -> int:
+        """Pooled channels created during the last minute."""
+        cutoff = time.monotonic() - 60
+        while self._created_at and self._created_at[0] < cutoff:
+            self._created_at.popleft()
+        return len(self._created_at)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "guilds": len(self._channels),
+            "claimed": self.claimed,
+            "misses": self.misses,
+            "created": self.created,
+            "refill_rate_per_minute": self.refill_rate()
+        }
+
+    def adopt(self, guild: nextcord.Guild):
+        """Take over pooled channels left in ``guild`` by a previous run (no API calls)."""
+        if not self.enabled:
+            return
+        channels = self._channels.setdefault(guild.id, deque())
+        known = set(channels)
+        for channel in guild.text_channels:
+            if channel.name == POOL_CHANNEL_NAME and channel.id not in known:
+                channels.append(channel.id)
+        if channels:
+            self.request_refill(guild)
+
+    def claim(self, guild: nextcord.Guild):
+        """Take a ready channel for ``guild``, or return None if the pool is empty."""
+        if not self.enabled:
+            return None
+
+        channels = self._channels.get(guild.id)
+        while channels:
+            channel = guild.get_channel(channels.popleft())
+            if channel is not None:
+                self.claimed += 1
+                self.request_refill(guild)
+                return channel
+
+        self.misses += 1
+        self.request_refill(guild)
+        return None
+
+    def discard(self, channel):
+        """Forget a pooled channel that was deleted."""
+        channels = self._channels.get(channel.guild.id)
+        if channels and channel.id in channels:
+            channels.remove(channel.id)
+            self.request_refill(channel.guild)
+
+    def request_refill(self, guild: nextcord.Guild):
+        if self.enabled:
+            self._pending[guild.id] = guild
+            self._wakeup.set()
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._refill_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _refill_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                _, guild = self._pending.popitem()
+                try:
+                    await self._fill(guild)
+                except Exception as e:
+                    metrics.log(f"Failed to refill ticket channel pool for guild {guild.id}: {str(e)}", level="error")
+
+    async def _fill(self, guild: nextcord.Guild):
+        category = await self.category_for(guild)
+        if category is None:
+            # Nothing to pool into until the guild has a ticket category
+            return
+
+        channels = self._channels.setdefault(guild.id, deque())
+        overwrites = {
+            guild.default_role: nextcord.PermissionOverwrite(read_messages=False),
+            guild.me: nextcord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
+        }
+        while len(channels) < self.size:
+            await self.rate_limiter.acquire("create_channel", guild.id)
+            channel = await guild.create_text_channel(
+                POOL_CHANNEL_NAME,
+                overwrites=overwrites,
+                category=category,
+                topic="Reserved for the next ticket"
+            )
+            channels.append(channel.id)
+            self.created += 1
+            self._created_at.append(time.monotonic())
@@ -0,0 +1,185 @@
+"""Runs the bot as a cluster of worker processes, each owning a range of shards.
+
+A single process shares one event loop and one core between every guild.
+The launcher splits the bot's shards into contiguous ranges and starts one
+``AutoShardedBot`` process per range, so guilds spread across cores. Each
+worker has its own storage connection pool (DB_POOL_* sizes apply per
+process) and, when METRICS_PORT is set, serves metrics on METRICS_PORT plus
+its cluster ID.
+
+Workers are started one after another, each once the previous one's shards
+are connected, to stay within Discord's identify rate limit. A worker that
+exits unexpectedly is restarted. SIGINT or SIGTERM shut every worker down
+cleanly.
+
+Usage::
+
+    python cluster.py
+
+configured with SHARD_COUNT and CLUSTER_PROCESSES in .env.
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import multiprocessing
+import aiohttp
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+
+# Upper bound on how long one shard takes to identify and receive its guilds
+SHARD_READY_TIMEOUT = 30.0
+
+# Seconds before a crashed worker is started again
+RESTART_DELAY = 5.0
+
+
+def shard_ranges(shard_count: int, processes: int) -> list:
+    """Split shard IDs ``0..shard_count-1`` into at most ``processes`` contiguous, near-equal ranges."""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        size = base + (1 if index < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+async def recommended_shard_count(token: str) -> int:
+    """Ask Discord how many shards the bot should run."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_BOT_URL, headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def _run_worker(cluster_id: int, shard_ids: list, shard_count: int, ready):
+    # Every worker needs its own metrics port
+    port = os.getenv("METRICS_PORT")
+    if port:
+        os.environ["METRICS_PORT"] = str(int(port) + cluster_id)
+    # ... and its own outbox journal, which only holds requests for its own guilds
+    path = os.getenv("OUTBOX_PATH", "outbox.db")
+    if path:
+        root, ext = os.path.splitext(path)
+        os.environ["OUTBOX_PATH"] = f"{root}-{cluster_id}{ext}"
+
+    # Imported here so the bot and its storage pool are created in the worker
+    import main
+    metrics.log(f"Cluster {cluster_id} starting", shards=f"{shard_ids[0]}-{shard_ids[-1]}", shard_count=shard_count)
+    asyncio.run(main.run_bot(os.getenv("DISCORD_BOT_TOKEN"), shard_ids, shard_count, ready.set))
+
+
+class Worker:
+    """One worker process and the shard range it runs."""
+
+    def __init__(self, context, cluster_id: int, shard_ids: list, shard_count: int):
+        self.context = context
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.ready = None
+
+    def start(self):
+        self.ready = self.context.Event()
+        self.process = self.context.Process(
+            target=_run_worker,
+            args=(self.cluster_id, self.shard_ids, self.shard_count, self.ready),
+            name=f"ticketbot-cluster-{self.cluster_id}"
+        )
+        self.process.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Launcher:
+    """Starts, supervises and stops the worker processes."""
+
+    def __init__(self, shard_count: int, processes: int, shutdown_timeout: float = 30.0):
+        context = multiprocessing.get_context("spawn")
+        self.workers = [
+            Worker(context, cluster_id, shard_ids, shard_count)
+            for cluster_id, shard_ids in enumerate(shard_ranges(shard_count, processes))
+        ]
+        self.shutdown_timeout = shutdown_timeout
+        self.stopping = False
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _start(self, worker: Worker):
+        worker.start()
+        # Let this worker's shards identify before the next worker starts
+        deadline = time.monotonic() + SHARD_READY_TIMEOUT * len(worker.shard_ids)
+        while not self.stopping and worker.alive and time.monotonic() < deadline:
+            if worker.ready.wait(1.0):
+                metrics.log(f"Cluster {worker.cluster_id} is ready")
+                return
+        if not self.stopping and not worker.ready.is_set():
+            metrics.log(f"Cluster {worker.cluster_id} did not become ready in time", level="warning")
+
+    def run(self) -> int:
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+
+        for worker in self.workers:
+            if self.stopping:
+                break
+            self._start(worker)
+
+        while not self.stopping:
+            time.sleep(1.0)
+            for worker in self.workers:
+                if self.stopping or worker.alive:
+                    continue
+                metrics.log(f"Cluster {worker.cluster_id} exited with code {worker.process.exitcode}, restarting",
+                            level="error")
+                time.sleep(RESTART_DELAY)
+                if not self.stopping:
+                    self._start(worker)
+
+        self.shutdown()
+        return 0
+
+    def shutdown(self):
+        """Ask every worker to stop, then kill the ones still running after the timeout."""
+        metrics.log("Shutting down cluster")
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                metrics.log(f"Cluster {worker.cluster_id} did not stop in time, killing it", level="warning")
+                worker.process.kill()
+                worker.process.join()
+
+
+def main() -> int:
+    import main as bot_main
+    shard_count = bot_main.shard_count_from_env()
+    if shard_count is None or shard_count == "auto":
+        shard_count = asyncio.run(recommended_shard_count(os.getenv("DISCORD_BOT_TOKEN")))
+    processes = int(os.getenv("CLUSTER_PROCESSES", 0)) or os.cpu_count() or 1
+
+    launcher = Launcher(shard_count, processes, float(os.getenv("CLUSTER_SHUTDOWN_TIMEOUT", 30)))
+    metrics.log(f"Starting {len(launcher.workers)} cluster processes for {shard_count} shards")
+    return launcher.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import time
+import asyncio
+from typing import Optional
+import metrics
+
+# Sentinel telling a run_bounded worker that the input is exhausted
+_STOP = object()
+
+# Seconds between sweeps of rate limiter buckets that have refilled
+PRUNE_INTERVAL = 60.0
+
+
+class RouteRateLimiter:
+    """Client-side token buckets keyed by Discord route and major parameter.
+
+    nextcord already waits out 429 responses, but a burst of requests that
+    all hit the same bucket just earns a series of 429s (and counts towards
+    the global invalid request limit). Pacing calls locally keeps bulk jobs
+    under the limit instead. ``limits`` maps a route name to ``(calls, per)``,
+    meaning at most ``calls`` requests every ``per`` seconds for each major
+    parameter (guild or channel ID).
+
+    A bucket that has refilled is indistinguishable from a new one, so idle
+    buckets are dropped periodically; otherwise every channel ever written
+    to would keep one for the life of the bot.
+    """
+
+    def __init__(self, limits: Optional[dict] = None, default: tuple = (5, 5.0)):
+        self.limits = limits or {}
+        self.default = default
+        self._buckets = {}
+        self._last_prune = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def prune(self):
+        """Drop the buckets that are full again and have no caller waiting on them."""
+        now = time.monotonic()
+        self._last_prune = now
+        idle = [
+            key for key, bucket in self._buckets.items()
+            if not bucket["lock"].locked()
+            and bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"] >= bucket["capacity"]
+        ]
+        for key in idle:
+            del self._buckets[key]
+
+    def _bucket(self, route: str, major_id):
+        if time.monotonic() - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+        key = (route, major_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            calls, per = self.limits.get(route, self.default)
+            bucket = self._buckets[key] = {
+                "tokens": float(calls),
+                "capacity": float(calls),
+                "rate": calls / per,
+                "updated": time.monotonic(),
+                "lock": asyncio.Lock()
+            }
+        return bucket
+
+    async def acquire(self, route: str, major_id=None) -> float:
+        """Wait until a call to ``route`` is allowed and return the seconds spent waiting."""
+        bucket = self._bucket(route, major_id)
+        waited = 0.0
+        async with bucket["lock"]:
+            while True:
+                now = time.monotonic()
+                bucket["tokens"] = min(bucket["capacity"], bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+                bucket["updated"] = now
+                if bucket["tokens"] >= 1:
+                    bucket["tokens"] -= 1
+                    if waited:
+                        metrics.RATELIMIT_WAIT_SECONDS.observe(waited, source="local", bucket=route)
+                    return waited
+                delay = (1 - bucket["tokens"]) / bucket["rate"]
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+async def run_bounded(items, handler, concurrency: int):
+    """Call ``handler(item)`` for every item with at most ``concurrency`` calls in flight.
+
+    ``items`` may be a regular or an async iterable and is consumed lazily,
+    so a large source is never held in memory all at once. If a handler
+    raises, the remaining work is cancelled and the exception propagates.
+    """
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def produce():
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                await queue.put(item)
+        else:
+            for item in items:
+                await queue.put(item)
+        for _ in range(concurrency):
+            await queue.put(_STOP)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is _STOP:
+                return
+            await handler(item)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks.extend(asyncio.create_task(work()) for _ in range(concurrency))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the coroutine; callers arriving while it
+    is still in flight wait for the same result instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls
+
+    async def do(self, key, func, *args):
+        """Run ``func(*args)`` once per key at a time; returns ``(result, shared)``.
+
+        ``shared`` is True for callers that joined a call already in flight.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shield the shared call so one waiter being cancelled doesn't cancel it for everyone
+        return await asyncio.shield(task), shared
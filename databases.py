@@ -1,255 +1,1760 @@
-import sqlite3
-from sqlite3 import dbapi2
-from typing import Optional
-from bson import ObjectId
-from pymongo import MongoClient
-import mysql.connector
-import ssl
-import certifi
-
-class DatabaseManager:
-    def __init__(self, database_type: str, database_name: str, 
-                 mongodb_connection_string: Optional[str] = None,
-                 mysql_config: Optional[dict] = None):
-        self.database_type = database_type
-        self.database_name = database_name
-
-        if database_type == 'sqlite':
-            if self.database_name.startswith('sqlitecloud://'):
-                self.connection = self.connect_to_cloud_sqlite(self.database_name)
-            else:
-                self.connection = sqlite3.connect(database_name)
-            
-            self.cursor = self.connection.cursor()
-            
-            # Create tickets table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tickets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    creator_id INTEGER NOT NULL,
-                    users TEXT NOT NULL
-                )
-            """)
-            
-            # Create settings table for storing category IDs
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS settings (
-                    guild_id INTEGER PRIMARY KEY,
-                    ticket_category_id INTEGER
-                )
-            """)
-
-            self.connection.commit()
-
-        elif database_type == 'mongodb' and mongodb_connection_string:
-            try:
-                self.client = MongoClient(
-                    mongodb_connection_string,
-                    tlsCAFile=certifi.where(),
-                    serverSelectionTimeoutMS=5000,
-                    connectTimeoutMS=5000,
-                    retryWrites=True,
-                    tls=True
-                )
-                self.client.server_info()
-                self.db = self.client[database_name]
-                self.collection = self.db["tickets"]
-                self.settings_collection = self.db["settings"]
-            except Exception as e:
-                print(f"MongoDB Connection Error: {str(e)}")
-                raise
-
-        elif database_type == 'mysql' and mysql_config:
-            self.mysql_connection = mysql.connector.connect(**mysql_config)
-            self.mysql_cursor = self.mysql_connection.cursor(dictionary=True)
-            
-            # Create tickets table
-            self.mysql_cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tickets (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    creator_id BIGINT NOT NULL,
-                    users TEXT NOT NULL
-                )
-            """)
-            
-            # Create settings table
-            self.mysql_cursor.execute("""
-                CREATE TABLE IF NOT EXISTS settings (
-                    guild_id BIGINT PRIMARY KEY,
-                    ticket_category_id BIGINT
-                )
-            """)
-            
-            self.mysql_connection.commit()
-
-    def connect_to_cloud_sqlite(self, connection_string: str) -> dbapi2.Connection:
-        """Connect to a cloud SQLite database."""
-        import sqlite3
-        import urllib.parse
-
-        parsed_url = urllib.parse.urlparse(connection_string.replace("sqlitecloud://", ""))
-        database_url = parsed_url.hostname
-        api_key = urllib.parse.parse_qs(parsed_url.query).get('apikey', [None])[0]
-
-        if api_key is None:
-            raise ValueError("API key is required for SQLite Cloud connection.")
-
-        connection = sqlite3.connect(f"file:{database_url}?mode=rwc&cache=shared", uri=True)
-        return connection
-
-    async def get_ticket_category(self, guild_id: int) -> Optional[int]:
-        """Get the ticket category ID for a guild."""
-        if self.database_type == 'sqlite':
-            self.cursor.execute("SELECT ticket_category_id FROM settings WHERE guild_id = ?", (guild_id,))
-            result = self.cursor.fetchone()
-            return result[0] if result else None
-
-        elif self.database_type == 'mongodb':
-            settings = self.settings_collection.find_one({"guild_id": guild_id})
-            return settings.get("ticket_category_id") if settings else None
-
-        elif self.database_type == 'mysql':
-            self.mysql_cursor.execute("SELECT ticket_category_id FROM settings WHERE guild_id = %s", (guild_id,))
-            result = self.mysql_cursor.fetchone()
-            return result["ticket_category_id"] if result else None
-
-    async def set_ticket_category(self, guild_id: int, category_id: int):
-        """Set the ticket category ID for a guild."""
-        if self.database_type == 'sqlite':
-            self.cursor.execute("""
-                INSERT OR REPLACE INTO settings (guild_id, ticket_category_id)
-                VALUES (?, ?)
-            """, (guild_id, category_id))
-            self.connection.commit()
-
-        elif self.database_type == 'mongodb':
-            self.settings_collection.update_one(
-                {"guild_id": guild_id},
-                {"$set": {"ticket_category_id": category_id}},
-                upsert=True
-            )
-
-        elif self.database_type == 'mysql':
-            self.mysql_cursor.execute("""
-                INSERT INTO settings (guild_id, ticket_category_id)
-                VALUES (%s, %s)
-                ON DUPLICATE KEY UPDATE ticket_category_id = VALUES(ticket_category_id)
-            """, (guild_id, category_id))
-            self.mysql_connection.commit()
-
-    async def create_ticket(self, creator_id: int) -> int:
-        if self.database_type == 'sqlite':
-            self.cursor.execute("INSERT INTO tickets (creator_id, users) VALUES (?, ?)", 
-                              (creator_id, str(creator_id)))
-            self.connection.commit()
-            return self.cursor.lastrowid
-
-        elif self.database_type == 'mongodb':
-            try:
-                ticket = {"creator_id": creator_id, "users": [creator_id]}
-                result = self.collection.insert_one(ticket)
-                return result.inserted_id
-            except Exception as e:
-                print(f"MongoDB Insert Error: {str(e)}")
-                raise
-
-        elif self.database_type == 'mysql':
-            query = "INSERT INTO tickets (creator_id, users) VALUES (%s, %s)"
-            self.mysql_cursor.execute(query, (creator_id, str(creator_id)))
-            self.mysql_connection.commit()
-            return self.mysql_cursor.lastrowid
-
-    async def add_user_to_ticket(self, ticket_id: int, user_id: int) -> Optional[int]:
-        if self.database_type == 'sqlite':
-            self.cursor.execute("SELECT users FROM tickets WHERE id = ?", (ticket_id,))
-            result = self.cursor.fetchone()
-            if result:
-                users = result[0].split(',')
-                if str(user_id) not in users:
-                    users.append(str(user_id))
-                    new_users = ','.join(users)
-                    self.cursor.execute("UPDATE tickets SET users = ? WHERE id = ?", (new_users, ticket_id))
-                    self.connection.commit()
-                    return ticket_id
-
-        elif self.database_type == 'mongodb':
-            try:
-                result = self.collection.update_one(
-                    {"_id": ObjectId(ticket_id)},
-                    {"$addToSet": {"users": user_id}}
-                )
-                if result.modified_count > 0:
-                    return ticket_id
-            except Exception as e:
-                print(f"MongoDB Update Error: {str(e)}")
-                return None
-
-        elif self.database_type == 'mysql':
-            self.mysql_cursor.execute("SELECT users FROM tickets WHERE id = %s", (ticket_id,))
-            result = self.mysql_cursor.fetchone()
-            if result:
-                users = result["users"].split(',')
-                if str(user_id) not in users:
-                    users.append(str(user_id))
-                    new_users = ','.join(users)
-                    query = "UPDATE tickets SET users = %s WHERE id = %s"
-                    self.mysql_cursor.execute(query, (new_users, ticket_id))
-                    self.mysql_connection.commit()
-                    return ticket_id
-        return None
-
-    async def delete_ticket(self, ticket_id):
-        if self.database_type == 'sqlite':
-            self.cursor.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
-            self.connection.commit()
-
-        elif self.database_type == 'mongodb':
-            try:
-                result = self.collection.delete_one({"_id": ObjectId(ticket_id)})
-                return result.deleted_count > 0
-            except Exception as e:
-                print(f"MongoDB Delete Error: {str(e)}")
-                return False
-
-        elif self.database_type == 'mysql':
-            query = "DELETE FROM tickets WHERE id = %s"
-            self.mysql_cursor.execute(query, (ticket_id,))
-            self.mysql_connection.commit()
-            return self.mysql_cursor.rowcount > 0
-
-    async def get_all_tickets(self) -> list:
-        """Get all tickets from the database."""
-        if self.database_type == 'sqlite':
-            self.cursor.execute("SELECT * FROM tickets")
-            return self.cursor.fetchall()
-
-        elif self.database_type == 'mongodb':
-            try:
-                return list(self.collection.find())
-            except Exception as e:
-                print(f"MongoDB Query Error: {str(e)}")
-                return []
-
-        elif self.database_type == 'mysql':
-            self.mysql_cursor.execute("SELECT * FROM tickets")
-            return self.mysql_cursor.fetchall()
-
-    def close(self):
-        """Close database connections."""
-        if self.database_type == 'sqlite':
-            self.connection.close()
-
-        elif self.database_type == 'mongodb':
-            self.client.close()
-
-        elif self.database_type == 'mysql':
-            self.mysql_cursor.close()
-            self.mysql_connection.close()
-
-    def __del__(self):
-        """Destructor to ensure connections are closed."""
-        try:
-            self.close()
-        except:
-            pass
-        
\ No newline at end of file
+import os
+import time
+import asyncio
+import functools
+import sqlite3
+import threading
+import queue
+from sqlite3 import dbapi2
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, AsyncIterator
+import schema
+import metrics
+from cache import TTLCache, ChannelIndex, MISSING
+
+
+# Ticket fields that can be requested from iter_tickets; "id" is always returned
+TICKET_FIELDS = ("id", "guild_id", "channel_id", "creator_id", "status", "created_at", "last_activity", "ticket_type",
+                 "users", "intent_key")
+
+# Status of a ticket whose transcript is being archived; the row is deleted once it is saved
+CLOSING = "closing"
+
+# Columns of a transcript pointer
+TRANSCRIPT_FIELDS = ("id", "ticket_id", "guild_id", "channel_id", "path", "message_count", "size_bytes", "created_at")
+
+# Storage engines by DATABASE_TYPE, filled in by @register_engine
+ENGINES = {}
+
+
+def register_engine(cls):
+    """Make an engine selectable by its ``name``."""
+    ENGINES[cls.name] = cls
+    return cls
+
+
+# Seconds per bucket of the daily ticket statistics (UTC days)
+STATS_DAY = 86400
+
+
+def stats_day(timestamp: int) -> int:
+    """Start of the UTC day ``timestamp`` falls in, which keys the daily statistics."""
+    return timestamp - timestamp % STATS_DAY
+
+
+class StatsDelta:
+    """Changes to the per-guild ticket counters made by one write.
+
+    Engines collect the changes while they write tickets and apply them in
+    the same transaction (or right after, on a MongoDB server without
+    transactions), one batch per counter table. Tickets without a guild are not counted.
+    """
+
+    def __init__(self, now: int = None):
+        self.day = stats_day(now or int(time.time()))
+        # guild_id -> [open_tickets, created_total, closed_total]
+        self.guilds = defaultdict(lambda: [0, 0, 0])
+        # (guild_id, user_id) -> [open_tickets, created_total]
+        self.users = defaultdict(lambda: [0, 0])
+        # (guild_id, day) -> [created, closed]
+        self.days = defaultdict(lambda: [0, 0])
+
+    def __bool__(self) -> bool:
+        return bool(self.guilds)
+
+    def created(self, guild_id: Optional[int], creator_id: int):
+        if guild_id is None:
+            return
+        self._opened(guild_id, creator_id, 1)
+        self.guilds[guild_id][1] += 1
+        self.users[(guild_id, creator_id)][1] += 1
+        self.days[(guild_id, self.day)][0] += 1
+
+    def closed(self, guild_id: Optional[int], creator_id: int, status: str):
+        if guild_id is None:
+            return
+        if status == "open":
+            self._opened(guild_id, creator_id, -1)
+        self.guilds[guild_id][2] += 1
+        self.days[(guild_id, self.day)][1] += 1
+
+    def status_changed(self, guild_id: Optional[int], creator_id: int, old: str, new: str):
+        if guild_id is None or (old == "open") == (new == "open"):
+            return
+        self._opened(guild_id, creator_id, 1 if new == "open" else -1)
+
+    def _opened(self, guild_id: int, creator_id: int, change: int):
+        self.guilds[guild_id][0] += change
+        self.users[(guild_id, creator_id)][0] += change
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no database connection becomes available in time."""
+
+
+class PoolConfig:
+    """Sizing and health check settings for a storage engine's connection pool."""
+
+    def __init__(self, min_size: int = 1, max_size: int = 10,
+                 acquire_timeout: float = 10.0, health_check_interval: float = 30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+    @classmethod
+    def from_env(cls) -> "PoolConfig":
+        """Build a pool config from the DB_POOL_* environment variables."""
+        return cls(
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            acquire_timeout=float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10.0)),
+            health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30.0))
+        )
+
+
+class ConnectionPool:
+    """An asyncio pool of blocking DB-API connections.
+
+    Each checked out connection is used by exactly one worker thread, so
+    concurrent coroutines never share a connection or a cursor. Connections
+    that have been idle longer than the health check interval are pinged
+    before they are handed out again and replaced if the ping fails.
+    """
+
+    def __init__(self, connect, ping, config: PoolConfig, name: str = "db"):
+        self._connect = connect
+        self._ping = ping
+        self.config = config
+        self.name = name
+        self._idle = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(config.max_size)
+        self._executor = ThreadPoolExecutor(max_workers=config.max_size, thread_name_prefix=f"ticketbot-{name}")
+
+    @property
+    def size(self) -> int:
+        """Number of open connections, idle or in use."""
+        return self._size
+
+    async def _in_thread(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def open(self):
+        """Open the minimum number of connections up front."""
+        while self._size < self.config.min_size:
+            connection = await self._in_thread(self._new_connection)
+            self._idle.append((connection, time.monotonic()))
+
+    def _new_connection(self):
+        connection = self._connect()
+        with self._lock:
+            self._size += 1
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self._size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _checkout(self):
+        while True:
+            try:
+                connection, last_used = self._idle.pop()
+            except IndexError:
+                return self._new_connection()
+
+            if time.monotonic() - last_used < self.config.health_check_interval:
+                return connection
+            try:
+                self._ping(connection)
+                return connection
+            except Exception as e:
+                metrics.log(f"Discarding unhealthy database connection: {str(e)}", level="warning", pool=self.name)
+                self._discard(connection)
+
+    def _call(self, func, args):
+        # Runs in a worker thread, which owns the connection until it is returned
+        connection = self._checkout()
+        try:
+            result = func(connection, *args)
+        except BaseException:
+            try:
+                connection.rollback()
+            except Exception:
+                self._discard(connection)
+                raise
+            self._idle.append((connection, time.monotonic()))
+            raise
+        self._idle.append((connection, time.monotonic()))
+        return result
+
+    async def run(self, func, *args):
+        """Run ``func(connection, *args)`` on a pooled connection in a worker thread."""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.config.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(
+                f"Timed out after {self.config.acquire_timeout}s waiting for a database connection"
+            ) from None
+
+        try:
+            return await self._in_thread(self._call, func, args)
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        """Close every idle connection and stop the worker threads."""
+        while self._idle:
+            connection, _ = self._idle.pop()
+            await self._in_thread(self._discard, connection)
+        self._executor.shutdown(wait=False)
+
+
+def _resolve(future: asyncio.Future, ok: bool, value):
+    if future.cancelled():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
+
+
+class SQLiteWriter:
+    """A single SQLite writer thread that group-commits queued writes.
+
+    SQLite allows one writer at a time, so several connections writing at
+    once only queue up on the database lock and eventually fail with
+    "database is locked". Every write is sent to this thread instead. It
+    takes all writes waiting in its queue (up to ``max_batch``), runs each
+    one in its own savepoint inside a single transaction and commits once,
+    so a burst of writes costs one commit instead of one per write. A write
+    that raises is rolled back to its savepoint without affecting the others.
+    """
+
+    def __init__(self, connect, max_batch: int = 256):
+        self._connect = connect
+        self.max_batch = max_batch
+        self.connection = None
+        self._queue = queue.Queue()
+        self._thread = None
+
+        self.batches = 0
+        self.writes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def open(self):
+        """Open the writer connection (blocking); writes are accepted once started.
+
+        A connection left open by an earlier attempt that failed before
+        :meth:`start` is closed first.
+        """
+        if self.running:
+            raise RuntimeError("The SQLite writer is already running")
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.connection = self._connect()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._loop, name="ticketbot-sqlite-writer", daemon=True)
+        self._thread.start()
+
+    async def run(self, func, *args):
+        """Run ``func(cursor, *args)`` in the next group commit and return its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((func, args, future, loop))
+        return await future
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Finish what was queued before close() was called
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+        self.connection.close()
+
+    def _commit(self, batch: list):
+        results = []
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for func, args, _, _ in batch:
+                cursor.execute("SAVEPOINT write")
+                try:
+                    results.append((True, func(cursor, *args)))
+                    cursor.execute("RELEASE write")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write")
+                    cursor.execute("RELEASE write")
+                    results.append((False, e))
+            cursor.execute("COMMIT")
+            self.batches += 1
+            self.writes += len(batch)
+        except Exception as e:
+            try:
+                self.connection.rollback()
+            except Exception:
+                pass
+            results = [(False, e)] * len(batch)
+        finally:
+            cursor.close()
+
+        for (_, _, future, loop), (ok, value) in zip(batch, results):
+            loop.call_soon_threadsafe(_resolve, future, ok, value)
+
+    async def close(self):
+        """Commit the writes already queued, then close the connection."""
+        if self._thread is None:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+            return
+        self._queue.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+
+class StorageEngine:
+    """Interface implemented by every storage backend.
+
+    Tickets are returned as dicts with at least ``id``, ``creator_id`` and
+    ``users`` keys, whatever the backend stores them as.
+    """
+    name = None
+
+    @classmethod
+    def load_driver(cls):
+        """Import the backend's client library.
+
+        Drivers are only imported for the engine that is actually selected,
+        so a SQLite deployment never pays for loading pymongo or the MySQL
+        connector.
+        """
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    def parse_ticket_id(self, value):
+        """Convert a ticket ID taken from user input into the backend's ID type."""
+        raise NotImplementedError
+
+    async def get_ticket_category(self, guild_id: int) -> Optional[int]:
+        raise NotImplementedError
+
+    async def set_ticket_category(self, guild_id: int, category_id: int):
+        raise NotImplementedError
+
+    async def get_idle_timeouts(self) -> dict:
+        """Return ``{guild_id: seconds}`` for every guild with an idle timeout set."""
+        raise NotImplementedError
+
+    async def set_idle_timeout(self, guild_id: int, seconds: Optional[int]):
+        raise NotImplementedError
+
+    async def get_ticket_types(self) -> list:
+        """Return every guild's configured ticket types as dicts, ``staff_role_ids`` as a list."""
+        raise NotImplementedError
+
+    async def save_ticket_types(self, guild_id: int, ticket_types: list):
+        """Insert or replace some of a guild's ticket types, keyed by name."""
+        raise NotImplementedError
+
+    async def delete_ticket_type(self, guild_id: int, name: str) -> bool:
+        raise NotImplementedError
+
+    async def create_ticket(self, creator_id: int, guild_id: Optional[int] = None, intent_key: Optional[str] = None,
+                            ticket_type: Optional[str] = None):
+        """Insert an open ticket and return its ID.
+
+        With ``intent_key``, creating a ticket for a key that already has
+        one returns the existing ticket instead, so a retried request never
+        creates a duplicate.
+        """
+        raise NotImplementedError
+
+    async def add_user_to_ticket(self, ticket_id, user_id: int):
+        raise NotImplementedError
+
+    async def delete_ticket(self, ticket_id) -> bool:
+        raise NotImplementedError
+
+    async def set_ticket_channel(self, ticket_id, channel_id: int):
+        raise NotImplementedError
+
+    async def set_ticket_status(self, ticket_id, status: str):
+        raise NotImplementedError
+
+    async def link_ticket_channel(self, guild_id: int, ticket_id, channel_id: int) -> bool:
+        """Record ``channel_id`` for an open ticket of the guild that has no channel yet.
+
+        Returns False, changing nothing, if there is no such ticket.
+        """
+        raise NotImplementedError
+
+    async def touch_tickets(self, activity: list):
+        """Record the last activity of many tickets at once from ``(ticket_id, timestamp)`` pairs."""
+        raise NotImplementedError
+
+    async def delete_tickets(self, guild_id: int, creator_id: Optional[int] = None,
+                             created_before: Optional[int] = None, status: Optional[str] = None) -> list:
+        """Delete every ticket of a guild matching the filters; returns their ``id`` and ``channel_id``."""
+        raise NotImplementedError
+
+    async def purge_orphans(self, guild_id: int) -> dict:
+        """Delete a guild's tickets that are no longer open or closing, and membership rows without a ticket.
+
+        Returns the number of ``tickets`` and ``members`` removed.
+        """
+        raise NotImplementedError
+
+    async def get_ticket_stats(self, guild_id: int, since_day: int, user_id: Optional[int] = None) -> dict:
+        """Read a guild's ticket counters, its daily counts from ``since_day`` and optionally one user's."""
+        raise NotImplementedError
+
+    async def rebuild_ticket_stats(self, guild_id: int):
+        """Recount a guild's open tickets from the tickets themselves."""
+        raise NotImplementedError
+
+    async def save_transcript(self, transcript: dict):
+        """Record where a closed ticket's transcript was archived."""
+        raise NotImplementedError
+
+    async def get_transcript(self, guild_id: int, ticket_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def get_user_tickets(self, user_id: int, guild_id: Optional[int] = None) -> list:
+        """Return the IDs of the tickets ``user_id`` is a member of."""
+        raise NotImplementedError
+
+    async def get_open_tickets(self, guild_id: int, creator_id: int) -> list:
+        """Return ``id``, ``channel_id`` and ``ticket_type`` of the open tickets a user created in a guild."""
+        raise NotImplementedError
+
+    async def fetch_tickets_page(self, guild_id: Optional[int], status: Optional[str],
+                                 fields: tuple, after, limit: int) -> list:
+        """Return up to ``limit`` tickets with an ID greater than ``after``, in ID order."""
+        raise NotImplementedError
+
+
+class SQLEngine(StorageEngine):
+    """Shared implementation for the DB-API backends.
+
+    Queries are written with ``?`` placeholders and translated by
+    :meth:`_sql` for drivers that use a different paramstyle.
+    """
+    placeholder = "?"
+    # Column types used by the migrations in schema.py
+    types = {}
+    # Upsert suffix, and how it refers to the value that was to be inserted
+    upsert_clause = None
+    excluded = None
+    insert_ignore = "INSERT OR IGNORE"
+
+    # Ticket members, collapsed back into one comma-joined value per row
+    users_column = """
+        (SELECT GROUP_CONCAT(user_id) FROM ticket_users WHERE ticket_users.ticket_id = tickets.id) AS users
+    """
+
+    def __init__(self, pool_config: PoolConfig):
+        self.pool = ConnectionPool(self._open_connection, self._ping, pool_config, name=self.name)
+
+    def _open_connection(self):
+        raise NotImplementedError
+
+    def _ping(self, connection):
+        raise NotImplementedError
+
+    def _cursor(self, connection):
+        return connection.cursor()
+
+    def _sql(self, query: str) -> str:
+        return query if self.placeholder == "?" else query.replace("?", self.placeholder)
+
+    @staticmethod
+    def _row_to_dict(cursor, row) -> Optional[dict]:
+        if row is None:
+            return None
+        if isinstance(row, dict):
+            return row
+        return {column[0]: value for column, value in zip(cursor.description, row)}
+
+    @staticmethod
+    def _ticket_from_row(row: dict) -> dict:
+        ticket = dict(row)
+        if "users" in ticket:
+            ticket["users"] = [int(user) for user in str(ticket["users"] or "").split(',') if user]
+        return ticket
+
+    def _upsert(self, cursor, table: str, keys: tuple, columns: tuple, rows: list, add: bool = False):
+        """Insert ``rows`` of ``keys + columns`` values, updating the rows that already exist.
+
+        With ``add`` the values are added to the existing ones instead of
+        replacing them, so counters can be changed without reading them.
+        """
+        if not rows:
+            return
+        updates = ", ".join(
+            f"{column} = {column} + {self.excluded.format(column=column)}" if add
+            else f"{column} = {self.excluded.format(column=column)}"
+            for column in columns
+        )
+        cursor.executemany(self._sql(f"""
+            INSERT INTO {table} ({', '.join(keys + columns)})
+            VALUES ({', '.join('?' for _ in keys + columns)})
+            {self.upsert_clause.format(keys=', '.join(keys), updates=updates)}
+        """), rows)
+
+    def _apply_stats(self, cursor, delta: StatsDelta):
+        if not delta:
+            return
+        self._upsert(cursor, "ticket_stats", ("guild_id",), ("open_tickets", "created_total", "closed_total"),
+                     [(guild_id, *counts) for guild_id, counts in delta.guilds.items()], add=True)
+        self._upsert(cursor, "ticket_user_stats", ("guild_id", "user_id"), ("open_tickets", "created_total"),
+                     [(*key, *counts) for key, counts in delta.users.items()], add=True)
+        self._upsert(cursor, "ticket_daily_stats", ("guild_id", "day"), ("created", "closed"),
+                     [(*key, *counts) for key, counts in delta.days.items()], add=True)
+
+    def _rebuild_stats(self, cursor, guild_id: Optional[int] = None, totals: bool = False):
+        """Recount open tickets with GROUP BY queries, for one guild or all of them.
+
+        Closed tickets are deleted, so cumulative totals can't be recounted;
+        ``totals`` seeds them from the stored tickets, which the first
+        migration does for tickets created before counting began.
+        """
+        where, params = ("guild_id = ?", [guild_id]) if guild_id is not None else ("guild_id IS NOT NULL", [])
+        cursor.execute(self._sql(f"UPDATE ticket_stats SET open_tickets = 0 WHERE {where}"), params)
+        cursor.execute(self._sql(f"UPDATE ticket_user_stats SET open_tickets = 0 WHERE {where}"), params)
+
+        cursor.execute(self._sql(f"""
+            SELECT guild_id, creator_id, status, COUNT(*) AS tickets FROM tickets
+            WHERE {where} GROUP BY guild_id, creator_id, status
+        """), params)
+        guilds = defaultdict(lambda: [0, 0])
+        users = defaultdict(lambda: [0, 0])
+        for row in cursor.fetchall():
+            row = self._row_to_dict(cursor, row)
+            opened = row["tickets"] if row["status"] == "open" else 0
+            for counts in (guilds[row["guild_id"]], users[(row["guild_id"], row["creator_id"])]):
+                counts[0] += opened
+                counts[1] += row["tickets"]
+
+        columns = ("open_tickets", "created_total") if totals else ("open_tickets",)
+        self._upsert(cursor, "ticket_stats", ("guild_id",), columns,
+                     [(key, *counts[:len(columns)]) for key, counts in guilds.items()])
+        self._upsert(cursor, "ticket_user_stats", ("guild_id", "user_id"), columns,
+                     [(*key, *counts[:len(columns)]) for key, counts in users.items()])
+
+        if totals:
+            cursor.execute(self._sql(f"""
+                SELECT guild_id, created_at - created_at % {STATS_DAY} AS day, COUNT(*) AS tickets FROM tickets
+                WHERE {where} AND created_at IS NOT NULL GROUP BY guild_id, created_at - created_at % {STATS_DAY}
+            """), params)
+            rows = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+            self._upsert(cursor, "ticket_daily_stats", ("guild_id", "day"), ("created",),
+                         [(row["guild_id"], row["day"], row["tickets"]) for row in rows])
+
+    def _transaction(self, connection, func, *args):
+        """Run ``func(cursor, *args)`` and commit, rolling back on failure."""
+        cursor = self._cursor(connection)
+        try:
+            result = func(cursor, *args)
+            connection.commit()
+            return result
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    async def _execute(self, func, *args):
+        return await self.pool.run(self._transaction, func, *args)
+
+    async def _read(self, func, *args):
+        """Like :meth:`_execute`, for queries that don't write."""
+        return await self._execute(func, *args)
+
+    async def connect(self):
+        await self.pool.open()
+        await self.pool.run(schema.migrate_sql, self)
+
+    def _table_columns(self, cursor, table: str) -> set:
+        raise NotImplementedError
+
+    def _add_column(self, cursor, table: str, column: str, definition: str):
+        """Add a column unless it already exists."""
+        if column not in self._table_columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _create_index(self, cursor, name: str, table: str, columns: tuple, unique: bool = False):
+        """Create an index unless it already exists."""
+        raise NotImplementedError
+
+    async def close(self):
+        await self.pool.close()
+
+    def parse_ticket_id(self, value) -> int:
+        return int(value)
+
+    async def get_ticket_category(self, guild_id: int) -> Optional[int]:
+        """Get the ticket category ID for a guild."""
+        def query(cursor):
+            cursor.execute(self._sql("SELECT ticket_category_id FROM settings WHERE guild_id = ?"), (guild_id,))
+            result = self._row_to_dict(cursor, cursor.fetchone())
+            return result["ticket_category_id"] if result else None
+        return await self._read(query)
+
+    async def set_ticket_category(self, guild_id: int, category_id: int):
+        """Set the ticket category ID for a guild."""
+        def query(cursor):
+            self._upsert(cursor, "settings", ("guild_id",), ("ticket_category_id",), [(guild_id, category_id)])
+        await self._execute(query)
+
+    async def get_idle_timeouts(self) -> dict:
+        def query(cursor):
+            cursor.execute("SELECT guild_id, idle_timeout FROM settings WHERE idle_timeout IS NOT NULL")
+            rows = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+            return {row["guild_id"]: row["idle_timeout"] for row in rows}
+        return await self._read(query)
+
+    async def set_idle_timeout(self, guild_id: int, seconds: Optional[int]):
+        def query(cursor):
+            self._upsert(cursor, "settings", ("guild_id",), ("idle_timeout",), [(guild_id, seconds)])
+        await self._execute(query)
+
+    # Ticket type columns besides the (guild_id, name) key
+    ticket_type_columns = ("label", "prefix", "emoji", "category_id", "staff_role_ids", "max_open", "position")
+
+    async def get_ticket_types(self) -> list:
+        def query(cursor):
+            cursor.execute(f"SELECT guild_id, name, {', '.join(self.ticket_type_columns)} FROM ticket_types")
+            rows = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+            for row in rows:
+                row["staff_role_ids"] = [int(role) for role in str(row["staff_role_ids"] or "").split(',') if role]
+            return rows
+        return await self._read(query)
+
+    async def save_ticket_types(self, guild_id: int, ticket_types: list):
+        rows = [
+            (guild_id, ticket_type["name"], *(
+                ",".join(str(role) for role in ticket_type[column]) if column == "staff_role_ids"
+                else ticket_type[column]
+                for column in self.ticket_type_columns
+            ))
+            for ticket_type in ticket_types
+        ]
+
+        def query(cursor):
+            self._upsert(cursor, "ticket_types", ("guild_id", "name"), self.ticket_type_columns, rows)
+        await self._execute(query)
+
+    async def delete_ticket_type(self, guild_id: int, name: str) -> bool:
+        def query(cursor):
+            cursor.execute(self._sql("DELETE FROM ticket_types WHERE guild_id = ? AND name = ?"), (guild_id, name))
+            return cursor.rowcount > 0
+        return await self._execute(query)
+
+    async def create_ticket(self, creator_id: int, guild_id: Optional[int] = None,
+                            intent_key: Optional[str] = None, ticket_type: Optional[str] = None) -> int:
+        def query(cursor):
+            if intent_key is not None:
+                # Served by idx_tickets_intent_key; a concurrent retry trips the unique index instead
+                cursor.execute(self._sql("SELECT id FROM tickets WHERE intent_key = ?"), (intent_key,))
+                existing = self._row_to_dict(cursor, cursor.fetchone())
+                if existing is not None:
+                    return existing["id"]
+
+            # The legacy users column only keeps the creator; membership lives in ticket_users
+            now = int(time.time())
+            cursor.execute(self._sql("""
+                INSERT INTO tickets (guild_id, creator_id, users, created_at, last_activity, intent_key, ticket_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """), (guild_id, creator_id, str(creator_id), now, now, intent_key, ticket_type))
+            # lastrowid belongs to this cursor, so concurrent inserts can't mix it up
+            ticket_id = cursor.lastrowid
+            cursor.execute(self._sql("INSERT INTO ticket_users (ticket_id, user_id) VALUES (?, ?)"),
+                           (ticket_id, creator_id))
+            delta = StatsDelta(now)
+            delta.created(guild_id, creator_id)
+            self._apply_stats(cursor, delta)
+            return ticket_id
+        return await self._execute(query)
+
+    async def add_user_to_ticket(self, ticket_id, user_id: int) -> Optional[int]:
+        """Add a member to a ticket; returns the ticket ID if the user was newly added."""
+        def query(cursor):
+            # A single idempotent statement: no read-modify-write, and nothing is
+            # inserted unless the ticket exists
+            cursor.execute(self._sql(f"""
+                {self.insert_ignore} INTO ticket_users (ticket_id, user_id)
+                SELECT id, ? FROM tickets WHERE id = ?
+            """), (user_id, ticket_id))
+            return ticket_id if cursor.rowcount > 0 else None
+        return await self._execute(query)
+
+    async def delete_ticket(self, ticket_id) -> bool:
+        def query(cursor):
+            cursor.execute(self._sql("SELECT guild_id, creator_id, status FROM tickets WHERE id = ?"), (ticket_id,))
+            ticket = self._row_to_dict(cursor, cursor.fetchone())
+            if ticket is None:
+                return False
+            cursor.execute(self._sql("DELETE FROM ticket_users WHERE ticket_id = ?"), (ticket_id,))
+            cursor.execute(self._sql("DELETE FROM tickets WHERE id = ?"), (ticket_id,))
+            delta = StatsDelta()
+            delta.closed(ticket["guild_id"], ticket["creator_id"], ticket["status"])
+            self._apply_stats(cursor, delta)
+            return True
+        return await self._execute(query)
+
+    async def set_ticket_channel(self, ticket_id, channel_id: int):
+        def query(cursor):
+            cursor.execute(self._sql("UPDATE tickets SET channel_id = ? WHERE id = ?"), (channel_id, ticket_id))
+        await self._execute(query)
+
+    async def link_ticket_channel(self, guild_id: int, ticket_id, channel_id: int) -> bool:
+        def query(cursor):
+            cursor.execute(self._sql("""
+                UPDATE tickets SET channel_id = ?
+                WHERE id = ? AND status = 'open' AND channel_id IS NULL AND (guild_id = ? OR guild_id IS NULL)
+            """), (channel_id, ticket_id, guild_id))
+            return cursor.rowcount > 0
+        return await self._execute(query)
+
+    async def set_ticket_status(self, ticket_id, status: str):
+        def query(cursor):
+            cursor.execute(self._sql("SELECT guild_id, creator_id, status FROM tickets WHERE id = ?"), (ticket_id,))
+            ticket = self._row_to_dict(cursor, cursor.fetchone())
+            if ticket is None or ticket["status"] == status:
+                return
+            cursor.execute(self._sql("UPDATE tickets SET status = ? WHERE id = ?"), (status, ticket_id))
+            delta = StatsDelta()
+            delta.status_changed(ticket["guild_id"], ticket["creator_id"], ticket["status"], status)
+            self._apply_stats(cursor, delta)
+        await self._execute(query)
+
+    async def touch_tickets(self, activity: list):
+        def query(cursor):
+            cursor.executemany(self._sql("UPDATE tickets SET last_activity = ? WHERE id = ?"),
+                               [(timestamp, ticket_id) for ticket_id, timestamp in activity])
+        await self._execute(query)
+
+    # Most IDs bound in one IN (...) list
+    max_ids_per_statement = 500
+
+    def _delete_ids(self, cursor, ids: list):
+        """Delete tickets and their members by ID, a few hundred per statement."""
+        for start in range(0, len(ids), self.max_ids_per_statement):
+            chunk = ids[start:start + self.max_ids_per_statement]
+            marks = ", ".join("?" for _ in chunk)
+            cursor.execute(self._sql(f"DELETE FROM ticket_users WHERE ticket_id IN ({marks})"), chunk)
+            cursor.execute(self._sql(f"DELETE FROM tickets WHERE id IN ({marks})"), chunk)
+
+    async def delete_tickets(self, guild_id: int, creator_id: Optional[int] = None,
+                             created_before: Optional[int] = None, status: Optional[str] = None) -> list:
+        # Bulk deletes only touch tickets recorded for this guild, never legacy ones without a guild
+        clauses, params = ["guild_id = ?"], [guild_id]
+        if creator_id is not None:
+            clauses.append("creator_id = ?")
+            params.append(creator_id)
+        if created_before is not None:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+
+        def query(cursor):
+            # Deleting exactly the selected IDs, in the same transaction, keeps a
+            # ticket created meanwhile from being removed without being reported
+            cursor.execute(self._sql(f"""
+                SELECT id, channel_id, guild_id, creator_id, status FROM tickets WHERE {' AND '.join(clauses)}
+            """), params)
+            tickets = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+            self._delete_ids(cursor, [ticket["id"] for ticket in tickets])
+            delta = StatsDelta()
+            for ticket in tickets:
+                delta.closed(ticket["guild_id"], ticket["creator_id"], ticket["status"])
+            self._apply_stats(cursor, delta)
+            return [{"id": ticket["id"], "channel_id": ticket["channel_id"]} for ticket in tickets]
+        return await self._execute(query)
+
+    async def purge_orphans(self, guild_id: int) -> dict:
+        def query(cursor):
+            cursor.execute(self._sql("""
+                SELECT id, guild_id, creator_id, status FROM tickets WHERE guild_id = ? AND status NOT IN ('open', ?)
+            """), (guild_id, CLOSING))
+            tickets = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+            ids = [ticket["id"] for ticket in tickets]
+            self._delete_ids(cursor, ids)
+            delta = StatsDelta()
+            for ticket in tickets:
+                delta.closed(ticket["guild_id"], ticket["creator_id"], ticket["status"])
+            self._apply_stats(cursor, delta)
+            cursor.execute("""
+                DELETE FROM ticket_users
+                WHERE NOT EXISTS (SELECT 1 FROM tickets WHERE tickets.id = ticket_users.ticket_id)
+            """)
+            return {"tickets": len(ids), "members": max(cursor.rowcount, 0)}
+        return await self._execute(query)
+
+    async def get_ticket_stats(self, guild_id: int, since_day: int, user_id: Optional[int] = None) -> dict:
+        def query(cursor):
+            # Primary key lookups only, however many tickets there are
+            cursor.execute(self._sql("""
+                SELECT open_tickets, created_total, closed_total FROM ticket_stats WHERE guild_id = ?
+            """), (guild_id,))
+            stats = self._row_to_dict(cursor, cursor.fetchone()) or {
+                "open_tickets": 0, "created_total": 0, "closed_total": 0
+            }
+            cursor.execute(self._sql("""
+                SELECT day, created, closed FROM ticket_daily_stats WHERE guild_id = ? AND day >= ? ORDER BY day
+            """), (guild_id, since_day))
+            stats["days"] = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+            stats["user"] = None
+            if user_id is not None:
+                cursor.execute(self._sql("""
+                    SELECT open_tickets, created_total FROM ticket_user_stats WHERE guild_id = ? AND user_id = ?
+                """), (guild_id, user_id))
+                stats["user"] = self._row_to_dict(cursor, cursor.fetchone()) or {"open_tickets": 0, "created_total": 0}
+            return stats
+        return await self._read(query)
+
+    async def rebuild_ticket_stats(self, guild_id: int):
+        await self._execute(self._rebuild_stats, guild_id)
+
+    async def save_transcript(self, transcript: dict):
+        columns = [field for field in TRANSCRIPT_FIELDS if field != "id"]
+        def query(cursor):
+            cursor.execute(
+                self._sql(f"INSERT INTO transcripts ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"),
+                tuple(transcript[column] for column in columns)
+            )
+        await self._execute(query)
+
+    async def get_transcript(self, guild_id: int, ticket_id: str) -> Optional[dict]:
+        def query(cursor):
+            # Served by idx_transcripts_guild_ticket; the latest archive wins
+            cursor.execute(self._sql(f"""
+                SELECT {', '.join(TRANSCRIPT_FIELDS)} FROM transcripts
+                WHERE guild_id = ? AND ticket_id = ?
+                ORDER BY id DESC LIMIT 1
+            """), (guild_id, ticket_id))
+            return self._row_to_dict(cursor, cursor.fetchone())
+        return await self._read(query)
+
+    async def get_user_tickets(self, user_id: int, guild_id: Optional[int] = None) -> list:
+        """Return the IDs of the tickets ``user_id`` is a member of."""
+        query_sql = """
+            SELECT tickets.id FROM ticket_users
+            JOIN tickets ON tickets.id = ticket_users.ticket_id
+            WHERE ticket_users.user_id = ?
+        """
+        params = [user_id]
+        if guild_id is not None:
+            query_sql += " AND (tickets.guild_id = ? OR tickets.guild_id IS NULL)"
+            params.append(guild_id)
+
+        def query(cursor):
+            cursor.execute(self._sql(query_sql + " ORDER BY tickets.id"), params)
+            return [self._row_to_dict(cursor, row)["id"] for row in cursor.fetchall()]
+        return await self._read(query)
+
+    async def get_open_tickets(self, guild_id: int, creator_id: int) -> list:
+        def query(cursor):
+            # Served by idx_tickets_creator_id
+            cursor.execute(self._sql("""
+                SELECT id, channel_id, ticket_type FROM tickets
+                WHERE creator_id = ? AND status = 'open' AND (guild_id = ? OR guild_id IS NULL)
+                ORDER BY id
+            """), (creator_id, guild_id))
+            return [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+        return await self._read(query)
+
+    async def fetch_tickets_page(self, guild_id: Optional[int], status: Optional[str],
+                                 fields: tuple, after, limit: int) -> list:
+        columns = ", ".join(
+            self.users_column if field == "users" else field
+            for field in TICKET_FIELDS
+            if field == "id" or field in fields
+        )
+        clauses, params = [], []
+        if guild_id is not None:
+            # Tickets created before guild tracking have no guild and belong to every guild
+            clauses.append("(guild_id = ? OR guild_id IS NULL)")
+            params.append(guild_id)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if after is not None:
+            clauses.append("id > ?")
+            params.append(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        def query(cursor):
+            cursor.execute(self._sql(f"SELECT {columns} FROM tickets {where} ORDER BY id LIMIT ?"), (*params, limit))
+            return [self._ticket_from_row(self._row_to_dict(cursor, row)) for row in cursor.fetchall()]
+        return await self._read(query)
+
+
+@register_engine
+class SQLiteEngine(SQLEngine):
+    """SQLite in WAL mode with one group-committing writer and a pool of readers.
+
+    Writes go through :class:`SQLiteWriter`; queries run on the read pool,
+    which WAL lets proceed while a write is in progress. In-memory and
+    SQLite Cloud databases are only reachable through one connection, so
+    there the writer runs the queries too.
+    """
+    name = 'sqlite'
+    types = {
+        "pk": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "int": "INTEGER",
+        "bigint": "INTEGER",
+        "text": "TEXT",
+        "status": "TEXT",
+        "key": "TEXT"
+    }
+    upsert_clause = "ON CONFLICT ({keys}) DO UPDATE SET {updates}"
+    excluded = "excluded.{column}"
+
+    # Applied to every local file connection. NORMAL is durable in WAL mode
+    # except for the last commits before a power loss
+    pragmas = (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA busy_timeout = 5000",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -16000",
+        "PRAGMA mmap_size = 268435456"
+    )
+
+    def __init__(self, database_name: str, pool_config: PoolConfig):
+        self.database_name = database_name
+        self.single_connection = database_name == ':memory:' or database_name.startswith('sqlitecloud://')
+        super().__init__(pool_config)
+        self.writer = SQLiteWriter(self._open_write_connection, int(os.getenv("SQLITE_WRITE_BATCH", 256)))
+
+    def _open_write_connection(self) -> dbapi2.Connection:
+        if self.database_name.startswith('sqlitecloud://'):
+            connection = self.connect_to_cloud_sqlite(self.database_name)
+        else:
+            connection = sqlite3.connect(self.database_name, check_same_thread=False)
+        if not self.single_connection:
+            connection.execute("PRAGMA journal_mode = WAL")
+            for pragma in self.pragmas:
+                connection.execute(pragma)
+        return connection
+
+    def _open_connection(self) -> dbapi2.Connection:
+        # Read pool connection
+        connection = sqlite3.connect(self.database_name, check_same_thread=False)
+        connection.isolation_level = None
+        for pragma in self.pragmas:
+            connection.execute(pragma)
+        connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    async def connect(self):
+        # Safe to call again after a failure: a running writer is kept, and only
+        # the steps that didn't complete are repeated
+        loop = asyncio.get_running_loop()
+        if not self.writer.running:
+            await loop.run_in_executor(None, self.writer.open)
+            # Migrations run on the writer connection before it takes any writes
+            await loop.run_in_executor(None, schema.migrate_sql, self.writer.connection, self)
+            # From here on the writer starts its own transactions
+            self.writer.connection.isolation_level = None
+            self.writer.start()
+        if not self.single_connection:
+            await self.pool.open()
+
+    async def close(self):
+        await self.writer.close()
+        await self.pool.close()
+
+    async def _execute(self, func, *args):
+        return await self.writer.run(func, *args)
+
+    async def _read(self, func, *args):
+        if self.single_connection:
+            return await self.writer.run(func, *args)
+        return await self.pool.run(self._transaction, func, *args)
+
+    def _ping(self, connection):
+        connection.execute("SELECT 1")
+
+    def _table_columns(self, cursor, table: str) -> set:
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+
+    def _create_index(self, cursor, name: str, table: str, columns: tuple, unique: bool = False):
+        """Create an index unless it already exists."""
+        cursor.execute(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+        )
+
+    def connect_to_cloud_sqlite(self, connection_string: str) -> dbapi2.Connection:
+        """Connect to a cloud SQLite database."""
+        import urllib.parse
+
+        parsed_url = urllib.parse.urlparse(connection_string.replace("sqlitecloud://", ""))
+        database_url = parsed_url.hostname
+        api_key = urllib.parse.parse_qs(parsed_url.query).get('apikey', [None])[0]
+
+        if api_key is None:
+            raise ValueError("API key is required for SQLite Cloud connection.")
+
+        connection = sqlite3.connect(f"file:{database_url}?mode=rwc&cache=shared", uri=True, check_same_thread=False)
+        return connection
+
+
+@register_engine
+class MySQLEngine(SQLEngine):
+    name = 'mysql'
+    placeholder = "%s"
+    types = {
+        "pk": "INT AUTO_INCREMENT PRIMARY KEY",
+        "int": "INT",
+        "bigint": "BIGINT",
+        "text": "TEXT",
+        "status": "VARCHAR(16)",
+        "key": "VARCHAR(64)"
+    }
+    upsert_clause = "ON DUPLICATE KEY UPDATE {updates}"
+    excluded = "VALUES({column})"
+    insert_ignore = "INSERT IGNORE"
+
+    @classmethod
+    def load_driver(cls):
+        import mysql.connector
+        cls.connector = mysql.connector
+
+    def __init__(self, mysql_config: dict, pool_config: PoolConfig):
+        self.mysql_config = mysql_config
+        super().__init__(pool_config)
+
+    def _open_connection(self):
+        return self.connector.connect(**self.mysql_config)
+
+    def _ping(self, connection):
+        connection.ping(reconnect=False)
+
+    def _cursor(self, connection):
+        return connection.cursor(dictionary=True)
+
+    def _table_columns(self, cursor, table: str) -> set:
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (table,))
+        return {row["COLUMN_NAME"] for row in cursor.fetchall()}
+
+    def _create_index(self, cursor, name: str, table: str, columns: tuple, unique: bool = False):
+        """Create an index unless it already exists."""
+        # MySQL has no CREATE INDEX IF NOT EXISTS
+        cursor.execute("""
+            SELECT 1 FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """, (table, name))
+        if not cursor.fetchall():
+            cursor.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})"
+            )
+
+
+@register_engine
+class MongoDBEngine(StorageEngine):
+    """MongoDB backend.
+
+    pymongo keeps its own connection pool, which is sized from the same
+    :class:`PoolConfig` as the SQL engines. Calls are blocking, so they run on
+    a worker pool no larger than the connection pool.
+
+    Writes that change the counters run in a transaction on replica sets and
+    sharded clusters. A standalone server has no transactions, so there the
+    counters are updated right after the tickets, and drift from a crash in
+    between is repaired by :meth:`rebuild_ticket_stats`.
+    """
+    name = 'mongodb'
+
+    @classmethod
+    def load_driver(cls):
+        import bson
+        import certifi
+        import pymongo
+        cls.ObjectId = bson.ObjectId
+        cls.MongoClient = pymongo.MongoClient
+        cls.UpdateOne = pymongo.UpdateOne
+        cls.certifi = certifi
+
+    def __init__(self, connection_string: str, database_name: str, pool_config: PoolConfig, tls: bool = True):
+        self.connection_string = connection_string
+        self.database_name = database_name
+        self.pool_config = pool_config
+        self.tls = tls
+        self.client = None
+        self.transactions = False
+        self._executor = ThreadPoolExecutor(max_workers=pool_config.max_size, thread_name_prefix="ticketbot-mongodb")
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def connect(self):
+        options = dict(
+            minPoolSize=self.pool_config.min_size,
+            maxPoolSize=self.pool_config.max_size,
+            waitQueueTimeoutMS=int(self.pool_config.acquire_timeout * 1000),
+            heartbeatFrequencyMS=max(int(self.pool_config.health_check_interval * 1000), 500),
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=5000,
+            retryWrites=True
+        )
+        if self.tls:
+            options.update(tls=True, tlsCAFile=self.certifi.where())
+
+        try:
+            self.client = await self._run(self.MongoClient, self.connection_string, **options)
+            await self._run(self.client.admin.command, "ping")
+            self.db = self.client[self.database_name]
+            self.collection = self.db["tickets"]
+            self.settings_collection = self.db["settings"]
+        except Exception as e:
+            metrics.log(f"MongoDB Connection Error: {str(e)}", level="error")
+            raise
+
+        # Multi-document transactions need a replica set or a sharded cluster;
+        # stand-ins such as mongomock don't describe a topology
+        topology = getattr(self.client, "topology_description", None)
+        self.transactions = topology is not None and topology.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+        await self._run(schema.migrate_mongodb, self.db)
+
+    async def close(self):
+        if self.client is not None:
+            await self._run(self.client.close)
+        self._executor.shutdown(wait=False)
+
+    def _write(self, func):
+        """Call ``func(session)``, in a transaction if the deployment has them; blocking, run in the worker pool."""
+        if not self.transactions:
+            return func(None)
+        with self.client.start_session() as session:
+            # Retried as a whole on transient errors, so func must not keep state between calls
+            return session.with_transaction(func)
+
+    def parse_ticket_id(self, value) -> "bson.ObjectId":
+        return self.ObjectId(value)
+
+    @staticmethod
+    def _ticket_from_document(document: dict, fields: tuple = ()) -> dict:
+        """Convert a ticket document; ``fields`` it lacks are set to None, as the SQL engines return them.
+
+        Documents only hold the fields they were written with, so tickets from
+        before a migration can be missing e.g. ``guild_id``.
+        """
+        ticket = dict.fromkeys(field for field in fields if field != "id")
+        ticket.update(document)
+        ticket["id"] = str(ticket.pop("_id"))
+        if "users" in ticket and ticket["users"] is None:
+            ticket["users"] = []
+        return ticket
+
+    async def get_ticket_category(self, guild_id: int) -> Optional[int]:
+        """Get the ticket category ID for a guild."""
+        settings = await self._run(self.settings_collection.find_one, {"guild_id": guild_id})
+        return settings.get("ticket_category_id") if settings else None
+
+    async def set_ticket_category(self, guild_id: int, category_id: int):
+        """Set the ticket category ID for a guild."""
+        await self._run(
+            self.settings_collection.update_one,
+            {"guild_id": guild_id},
+            {"$set": {"ticket_category_id": category_id}},
+            upsert=True
+        )
+
+    async def get_idle_timeouts(self) -> dict:
+        documents = await self._run(lambda: list(self.settings_collection.find(
+            {"idle_timeout": {"$type": "number"}}, {"guild_id": 1, "idle_timeout": 1}
+        )))
+        return {document["guild_id"]: document["idle_timeout"] for document in documents}
+
+    async def set_idle_timeout(self, guild_id: int, seconds: Optional[int]):
+        await self._run(
+            self.settings_collection.update_one,
+            {"guild_id": guild_id},
+            {"$set": {"idle_timeout": seconds}},
+            upsert=True
+        )
+
+    async def get_ticket_types(self) -> list:
+        documents = await self._run(lambda: list(self.db.ticket_types.find({}, {"_id": 0})))
+        for document in documents:
+            document["staff_role_ids"] = list(document.get("staff_role_ids") or [])
+        return documents
+
+    async def save_ticket_types(self, guild_id: int, ticket_types: list):
+        def save():
+            for ticket_type in ticket_types:
+                self.db.ticket_types.update_one(
+                    {"guild_id": guild_id, "name": ticket_type["name"]},
+                    {"$set": {**ticket_type, "guild_id": guild_id, "staff_role_ids": list(ticket_type["staff_role_ids"])}},
+                    upsert=True
+                )
+        await self._run(save)
+
+    async def delete_ticket_type(self, guild_id: int, name: str) -> bool:
+        result = await self._run(self.db.ticket_types.delete_one, {"guild_id": guild_id, "name": name})
+        return result.deleted_count > 0
+
+    async def create_ticket(self, creator_id: int, guild_id: Optional[int] = None,
+                            intent_key: Optional[str] = None, ticket_type: Optional[str] = None) -> "bson.ObjectId":
+        now = int(time.time())
+        delta = StatsDelta(now)
+        delta.created(guild_id, creator_id)
+
+        def create(session):
+            if intent_key is not None:
+                existing = self.collection.find_one({"intent_key": intent_key}, {"_id": 1}, session=session)
+                if existing is not None:
+                    return existing["_id"]
+
+            ticket = {
+                "guild_id": guild_id,
+                "channel_id": None,
+                "creator_id": creator_id,
+                "status": "open",
+                "created_at": now,
+                "last_activity": now,
+                "ticket_type": ticket_type,
+                "users": [creator_id]
+            }
+            if intent_key is not None:
+                ticket["intent_key"] = intent_key
+            result = self.collection.insert_one(ticket, session=session)
+            self._apply_stats(delta, session)
+            return result.inserted_id
+
+        try:
+            return await self._run(self._write, create)
+        except Exception as e:
+            metrics.log(f"MongoDB Insert Error: {str(e)}", level="error")
+            raise
+
+    async def add_user_to_ticket(self, ticket_id, user_id: int) -> Optional[str]:
+        try:
+            result = await self._run(
+                self.collection.update_one,
+                {"_id": self.ObjectId(ticket_id)},
+                {"$addToSet": {"users": user_id}}
+            )
+            if result.modified_count > 0:
+                return ticket_id
+        except Exception as e:
+            metrics.log(f"MongoDB Update Error: {str(e)}", level="error")
+        return None
+
+    async def delete_ticket(self, ticket_id) -> bool:
+        def delete(session):
+            ticket = self.collection.find_one_and_delete(
+                {"_id": self.ObjectId(ticket_id)},
+                projection={"guild_id": 1, "creator_id": 1, "status": 1},
+                session=session
+            )
+            if ticket is None:
+                return False
+            delta = StatsDelta()
+            delta.closed(ticket.get("guild_id"), ticket["creator_id"], ticket.get("status", "open"))
+            self._apply_stats(delta, session)
+            return True
+
+        try:
+            return await self._run(self._write, delete)
+        except Exception as e:
+            metrics.log(f"MongoDB Delete Error: {str(e)}", level="error")
+            return False
+
+    async def set_ticket_channel(self, ticket_id, channel_id: int):
+        await self._run(
+            self.collection.update_one,
+            {"_id": self.ObjectId(ticket_id)},
+            {"$set": {"channel_id": channel_id}}
+        )
+
+    async def link_ticket_channel(self, guild_id: int, ticket_id, channel_id: int) -> bool:
+        query = {"_id": self.ObjectId(ticket_id), "status": "open", "channel_id": None,
+                 "guild_id": {"$in": [guild_id, None]}}
+        result = await self._run(self.collection.update_one, query, {"$set": {"channel_id": channel_id}})
+        return result.modified_count > 0
+
+    async def set_ticket_status(self, ticket_id, status: str):
+        def update(session):
+            # Returns the document as it was, so the counters see the old status
+            ticket = self.collection.find_one_and_update(
+                {"_id": self.ObjectId(ticket_id), "status": {"$ne": status}},
+                {"$set": {"status": status}},
+                projection={"guild_id": 1, "creator_id": 1, "status": 1},
+                session=session
+            )
+            if ticket is not None:
+                delta = StatsDelta()
+                delta.status_changed(ticket.get("guild_id"), ticket["creator_id"], ticket.get("status", "open"), status)
+                self._apply_stats(delta, session)
+        await self._run(self._write, update)
+
+    async def touch_tickets(self, activity: list):
+        await self._run(self.collection.bulk_write, [
+            self.UpdateOne({"_id": self.ObjectId(ticket_id)}, {"$set": {"last_activity": timestamp}})
+            for ticket_id, timestamp in activity
+        ], ordered=False)
+
+    async def delete_tickets(self, guild_id: int, creator_id: Optional[int] = None,
+                             created_before: Optional[int] = None, status: Optional[str] = None) -> list:
+        # Bulk deletes only touch tickets recorded for this guild, never legacy ones without a guild
+        query = {"guild_id": guild_id}
+        if creator_id is not None:
+            query["creator_id"] = creator_id
+        if created_before is not None:
+            query["created_at"] = {"$lt": created_before}
+        if status is not None:
+            query["status"] = status
+
+        documents = await self._run(self._write, functools.partial(self._delete_found, query))
+        return [{"id": str(document["_id"]), "channel_id": document.get("channel_id")} for document in documents]
+
+    async def purge_orphans(self, guild_id: int) -> dict:
+        # Members are stored on the ticket document, so only tickets can be orphaned
+        query = {"guild_id": guild_id, "status": {"$nin": ["open", CLOSING]}}
+        documents = await self._run(self._write, functools.partial(self._delete_found, query))
+        return {"tickets": len(documents), "members": 0}
+
+    def _delete_found(self, query: dict, session) -> list:
+        """Delete and count the tickets matching ``query``; returns their documents. Blocking."""
+        # Delete exactly the tickets that were found, so none is removed without being reported
+        documents = list(self.collection.find(query, {"channel_id": 1, "guild_id": 1, "creator_id": 1, "status": 1},
+                                              session=session))
+        if documents:
+            self.collection.delete_many({"_id": {"$in": [document["_id"] for document in documents]}}, session=session)
+            delta = StatsDelta()
+            for document in documents:
+                delta.closed(document.get("guild_id"), document["creator_id"], document.get("status", "open"))
+            self._apply_stats(delta, session)
+        return documents
+
+    def _apply_stats(self, delta: StatsDelta, session=None):
+        """Add ``delta`` to the counter documents; blocking, run in the worker pool."""
+        for guild_id, (opened, created, closed) in delta.guilds.items():
+            self.db.ticket_stats.update_one(
+                {"guild_id": guild_id},
+                {"$inc": {"open_tickets": opened, "created_total": created, "closed_total": closed}},
+                upsert=True, session=session
+            )
+        for (guild_id, user_id), (opened, created) in delta.users.items():
+            self.db.ticket_user_stats.update_one(
+                {"guild_id": guild_id, "user_id": user_id},
+                {"$inc": {"open_tickets": opened, "created_total": created}},
+                upsert=True, session=session
+            )
+        for (guild_id, day), (created, closed) in delta.days.items():
+            self.db.ticket_daily_stats.update_one(
+                {"guild_id": guild_id, "day": day},
+                {"$inc": {"created": created, "closed": closed}},
+                upsert=True, session=session
+            )
+
+    async def get_ticket_stats(self, guild_id: int, since_day: int, user_id: Optional[int] = None) -> dict:
+        def read():
+            # Served by the unique indexes on the counter collections
+            guild = self.db.ticket_stats.find_one({"guild_id": guild_id}) or {}
+            stats = {field: guild.get(field, 0) for field in ("open_tickets", "created_total", "closed_total")}
+            stats["days"] = [
+                {"day": day["day"], "created": day.get("created", 0), "closed": day.get("closed", 0)}
+                for day in self.db.ticket_daily_stats.find({"guild_id": guild_id, "day": {"$gte": since_day}}).sort("day", 1)
+            ]
+            stats["user"] = None
+            if user_id is not None:
+                user = self.db.ticket_user_stats.find_one({"guild_id": guild_id, "user_id": user_id}) or {}
+                stats["user"] = {field: user.get(field, 0) for field in ("open_tickets", "created_total")}
+            return stats
+        return await self._run(read)
+
+    async def rebuild_ticket_stats(self, guild_id: int):
+        await self._run(schema.rebuild_mongodb_ticket_stats, self.db, guild_id)
+
+    async def save_transcript(self, transcript: dict):
+        await self._run(self.db.transcripts.insert_one, dict(transcript))
+
+    async def get_transcript(self, guild_id: int, ticket_id: str) -> Optional[dict]:
+        def find_latest():
+            return next(iter(
+                self.db.transcripts.find({"guild_id": guild_id, "ticket_id": ticket_id}).sort("_id", -1).limit(1)
+            ), None)
+        document = await self._run(find_latest)
+        if document is None:
+            return None
+        document["id"] = str(document.pop("_id"))
+        return document
+
+    async def get_user_tickets(self, user_id: int, guild_id: Optional[int] = None) -> list:
+        """Return the IDs of the tickets ``user_id`` is a member of."""
+        query = {"users": user_id}
+        if guild_id is not None:
+            query["guild_id"] = {"$in": [guild_id, None]}
+        documents = await self._run(lambda: list(self.collection.find(query, {"_id": 1}).sort("_id", 1)))
+        return [str(document["_id"]) for document in documents]
+
+    async def get_open_tickets(self, guild_id: int, creator_id: int) -> list:
+        query = {"creator_id": creator_id, "status": "open", "guild_id": {"$in": [guild_id, None]}}
+        documents = await self._run(
+            lambda: list(self.collection.find(query, {"channel_id": 1, "ticket_type": 1}).sort("_id", 1))
+        )
+        return [self._ticket_from_document(document, ("channel_id", "ticket_type")) for document in documents]
+
+    async def fetch_tickets_page(self, guild_id: Optional[int], status: Optional[str],
+                                 fields: tuple, after, limit: int) -> list:
+        query = {}
+        if guild_id is not None:
+            # Tickets created before guild tracking have no guild and belong to every guild
+            query["guild_id"] = {"$in": [guild_id, None]}
+        if status is not None:
+            query["status"] = status
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        projection = {field: 1 for field in fields if field != "id"}
+
+        def find_page():
+            return list(self.collection.find(query, projection).sort("_id", 1).limit(limit))
+
+        try:
+            documents = await self._run(find_page)
+        except Exception as e:
+            metrics.log(f"MongoDB Query Error: {str(e)}", level="error")
+            raise
+        return [self._ticket_from_document(document, fields) for document in documents]
+
+
+class DatabaseManager:
+    """Front end used by the bot; delegates to the engine for ``database_type``.
+
+    The engine connects lazily on first use, or eagerly via :meth:`connect`.
+    """
+
+    def __init__(self, database_type: str, database_name: str,
+                 mongodb_connection_string: Optional[str] = None,
+                 mysql_config: Optional[dict] = None,
+                 pool_config: Optional[PoolConfig] = None,
+                 mongodb_tls: bool = True,
+                 settings_cache: Optional[TTLCache] = None):
+        self.database_type = database_type
+        self.database_name = database_name
+        self.pool_config = pool_config or PoolConfig.from_env()
+
+        # Guild settings are read on every ticket action but almost never change
+        self.settings_cache = settings_cache or TTLCache(
+            maxsize=int(os.getenv("SETTINGS_CACHE_SIZE", 10000)),
+            ttl=float(os.getenv("SETTINGS_CACHE_TTL", 300))
+        )
+
+        engine_class = ENGINES.get(database_type)
+        if engine_class is None:
+            raise ValueError(f"Unsupported database type: {database_type!r}")
+
+        # Seconds spent importing the driver and connecting, reported at startup
+        self.timings = {}
+        started = time.perf_counter()
+        engine_class.load_driver()
+        self.timings["driver_import"] = time.perf_counter() - started
+
+        if database_type == 'sqlite':
+            self.engine = SQLiteEngine(database_name, self.pool_config)
+
+        elif database_type == 'mongodb' and mongodb_connection_string:
+            self.engine = MongoDBEngine(mongodb_connection_string, database_name, self.pool_config, tls=mongodb_tls)
+
+        elif database_type == 'mysql' and mysql_config:
+            self.engine = MySQLEngine(mysql_config, self.pool_config)
+
+        else:
+            raise ValueError(f"Incomplete database configuration: {database_type!r}")
+
+        # channel_id <-> ticket ID for open tickets, so a channel resolves to
+        # its ticket without parsing names or querying
+        self.channel_index = ChannelIndex()
+
+        # Rows fetched per query when streaming tickets
+        self.batch_size = int(os.getenv("TICKET_BATCH_SIZE", 100))
+
+        self._connected = False
+        self._connect_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> "DatabaseManager":
+        """Build a manager from the variables documented in example.env."""
+        database_type = os.getenv("DATABASE_TYPE", "sqlite").lower()
+
+        if database_type == 'mongodb':
+            database_name = os.getenv("MONGODB_DATABASE", "tickets")
+            connection_string = os.getenv("MONGODB_CONNECTION_STRING")
+            if connection_string:
+                return cls('mongodb', database_name, mongodb_connection_string=connection_string)
+
+            # Fall back to the individual host settings, which don't use TLS
+            connection_string = (
+                f"mongodb://{os.getenv('MONGODB_USER')}:{os.getenv('MONGODB_PASSWORD')}"
+                f"@{os.getenv('MONGODB_HOST')}:{os.getenv('MONGODB_PORT', 27018)}/{database_name}"
+            )
+            return cls('mongodb', database_name, mongodb_connection_string=connection_string, mongodb_tls=False)
+
+        if database_type == 'mysql':
+            mysql_config = {
+                "host": os.getenv("MYSQL_HOST"),
+                "user": os.getenv("MYSQL_USER"),
+                "password": os.getenv("MYSQL_PASSWORD"),
+                "database": os.getenv("MYSQL_DATABASE"),
+                "port": int(os.getenv("MYSQL_PORT", 3306))
+            }
+            return cls('mysql', mysql_config["database"], mysql_config=mysql_config)
+
+        return cls(database_type, os.getenv("DATABASE_NAME", "tickets.db"))
+
+    async def connect(self):
+        """Open the engine's connection pool and create the schema if needed."""
+        if self._connected:
+            return
+        async with self._connect_lock:
+            if not self._connected:
+                started = time.perf_counter()
+                with metrics.time_db(self.database_type, "connect"):
+                    await self.engine.connect()
+                self.timings["connect"] = time.perf_counter() - started
+                self._connected = True
+
+    async def _call(self, operation: str, *args):
+        """Run ``engine.<operation>(*args)``, connecting first and recording its latency."""
+        await self.connect()
+        with metrics.time_db(self.database_type, operation):
+            return await getattr(self.engine, operation)(*args)
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def parse_ticket_id(self, value):
+        """Convert a ticket ID string into the backend's ID type, raising on invalid input."""
+        return self.engine.parse_ticket_id(value)
+
+    async def get_ticket_category(self, guild_id: int) -> Optional[int]:
+        """Get the ticket category ID for a guild, served from the settings cache when possible."""
+        category_id = self.settings_cache.get(guild_id)
+        if category_id is not MISSING:
+            return category_id
+
+        category_id = await self._call("get_ticket_category", guild_id)
+        self.settings_cache.set(guild_id, category_id)
+        return category_id
+
+    async def set_ticket_category(self, guild_id: int, category_id: int):
+        """Set the ticket category ID for a guild, writing through to the settings cache."""
+        await self._call("set_ticket_category", guild_id, category_id)
+        self.settings_cache.set(guild_id, category_id)
+
+    async def get_idle_timeouts(self) -> dict:
+        """Return ``{guild_id: seconds}`` for every guild with its own idle timeout."""
+        return await self._call("get_idle_timeouts")
+
+    async def set_idle_timeout(self, guild_id: int, seconds: Optional[int]):
+        """Set a guild's idle timeout in seconds; 0 disables it and None restores the default."""
+        await self._call("set_idle_timeout", guild_id, seconds)
+
+    def invalidate_settings(self, guild_id: int):
+        """Forget the cached settings for a guild so the next read goes to the database."""
+        self.settings_cache.invalidate(guild_id)
+
+    async def get_ticket_types(self) -> list:
+        """Return every guild's configured ticket types; read once at startup."""
+        return await self._call("get_ticket_types")
+
+    async def save_ticket_types(self, guild_id: int, ticket_types: list):
+        await self._call("save_ticket_types", guild_id, ticket_types)
+
+    async def delete_ticket_type(self, guild_id: int, name: str) -> bool:
+        return await self._call("delete_ticket_type", guild_id, name)
+
+    async def create_ticket(self, creator_id: int, guild_id: Optional[int] = None, intent_key: Optional[str] = None,
+                            ticket_type: Optional[str] = None):
+        return await self._call("create_ticket", creator_id, guild_id, intent_key, ticket_type)
+
+    async def add_user_to_ticket(self, ticket_id, user_id: int):
+        return await self._call("add_user_to_ticket", self.parse_ticket_id(ticket_id), user_id)
+
+    async def delete_ticket(self, ticket_id) -> bool:
+        deleted = await self._call("delete_ticket", self.parse_ticket_id(ticket_id))
+        self.channel_index.discard_ticket(ticket_id)
+        return deleted
+
+    async def set_ticket_channel(self, ticket_id, channel_id: int):
+        """Record the channel a ticket lives in, in the database and the channel index."""
+        await self._call("set_ticket_channel", self.parse_ticket_id(ticket_id), channel_id)
+        self.channel_index.add(channel_id, ticket_id)
+
+    async def link_ticket_channel(self, guild_id: int, ticket_id, channel_id: int) -> bool:
+        """Record the channel of an open ticket of the guild that has none yet, in the database and the index.
+
+        Returns False if the ticket doesn't exist, isn't open, belongs to
+        another guild or already has a channel.
+        """
+        linked = await self._call("link_ticket_channel", guild_id, self.parse_ticket_id(ticket_id), channel_id)
+        if linked:
+            self.channel_index.add(channel_id, ticket_id)
+        return linked
+
+    async def set_ticket_status(self, ticket_id, status: str):
+        """Change a ticket's status; only "open" tickets stay in the channel index."""
+        await self._call("set_ticket_status", self.parse_ticket_id(ticket_id), status)
+        if status != "open":
+            self.channel_index.discard_ticket(ticket_id)
+
+    async def delete_tickets(self, guild_id: int, creator_id: Optional[int] = None,
+                             created_before: Optional[int] = None, status: Optional[str] = None) -> list:
+        """Delete a guild's tickets matching every given filter in one set-based operation.
+
+        Returns ``id`` and ``channel_id`` of the deleted tickets, whose
+        channels are left for the caller to remove.
+        """
+        tickets = await self._call("delete_tickets", guild_id, creator_id, created_before, status)
+        for ticket in tickets:
+            ticket["id"] = str(ticket["id"])
+            self.channel_index.discard_ticket(ticket["id"])
+        return tickets
+
+    async def purge_orphans(self, guild_id: int) -> dict:
+        """Delete a guild's tickets that are no longer open or closing, and membership rows left without a ticket."""
+        return await self._call("purge_orphans", guild_id)
+
+    async def get_ticket_stats(self, guild_id: int, days: int = 7, user_id: Optional[int] = None) -> dict:
+        """Return a guild's ticket counters and the created/closed counts of its last ``days`` days.
+
+        Counters are kept up to date by every write, so this is a few key
+        lookups whatever the number of tickets. With ``user_id``, ``user``
+        holds that member's open and created tickets.
+        """
+        since_day = stats_day(int(time.time())) - (days - 1) * STATS_DAY
+        return await self._call("get_ticket_stats", guild_id, since_day, user_id)
+
+    async def rebuild_ticket_stats(self, guild_id: int):
+        """Recount a guild's open tickets on the database server, repairing counters that drifted."""
+        await self._call("rebuild_ticket_stats", guild_id)
+
+    async def touch_tickets(self, activity: dict):
+        """Write the last activity of many tickets, given as ``{ticket_id: timestamp}``, in one batch."""
+        if activity:
+            await self._call("touch_tickets", [
+                (self.parse_ticket_id(ticket_id), timestamp) for ticket_id, timestamp in activity.items()
+            ])
+
+    async def save_transcript(self, ticket_id, guild_id: int, channel_id: int, path: str,
+                              message_count: int, size_bytes: int):
+        """Record the archive file holding a closed ticket's transcript."""
+        await self._call("save_transcript", {
+            "ticket_id": str(ticket_id),
+            "guild_id": guild_id,
+            "channel_id": channel_id,
+            "path": path,
+            "message_count": message_count,
+            "size_bytes": size_bytes,
+            "created_at": int(time.time())
+        })
+
+    async def get_transcript(self, guild_id: int, ticket_id) -> Optional[dict]:
+        """Return the latest transcript pointer for a ticket, or None."""
+        return await self._call("get_transcript", guild_id, str(ticket_id))
+
+    def ticket_for_channel(self, channel_id: int):
+        """Return the ID of the open ticket living in ``channel_id``, or None. No query is made."""
+        return self.channel_index.get(channel_id)
+
+    async def warm_channel_index(self, guild_ids: Optional[set] = None):
+        """Load the channel of every open ticket into the channel index.
+
+        With ``guild_ids``, only tickets of those guilds (and legacy tickets
+        without a guild) are indexed, so a process running a subset of the
+        bot's shards doesn't hold every other process's channels.
+        """
+        async for ticket in self.iter_tickets(status="open", fields=("guild_id", "channel_id")):
+            if ticket["channel_id"] is None:
+                continue
+            if guild_ids is not None and ticket["guild_id"] is not None and ticket["guild_id"] not in guild_ids:
+                continue
+            self.channel_index.add(ticket["channel_id"], ticket["id"])
+
+    async def get_user_tickets(self, user_id: int, guild_id: Optional[int] = None) -> list:
+        """Return the IDs of the tickets ``user_id`` is a member of, optionally within one guild."""
+        return await self._call("get_user_tickets", user_id, guild_id)
+
+    async def get_open_tickets(self, guild_id: int, creator_id: int) -> list:
+        """Return ``id``, ``channel_id`` and ``ticket_type`` of the open tickets a user created in a guild."""
+        return await self._call("get_open_tickets", guild_id, creator_id)
+
+    async def iter_tickets(self, guild_id: Optional[int] = None, status: Optional[str] = None,
+                           fields: tuple = TICKET_FIELDS, batch_size: Optional[int] = None) -> AsyncIterator[dict]:
+        """Stream tickets in ID order, ``batch_size`` rows per query.
+
+        ``guild_id`` and ``status`` are filtered by the database and only the
+        requested ``fields`` are fetched, so memory stays flat however many
+        tickets are stored. Pages use keyset pagination: each one is a
+        separate indexed range query on the primary key, so no connection or
+        server-side cursor is held while the caller works.
+        """
+        unknown = set(fields) - set(TICKET_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown ticket fields: {', '.join(sorted(unknown))}")
+        fields = tuple(fields)
+        batch_size = batch_size or self.batch_size
+
+        after = None
+        while True:
+            page = await self._call("fetch_tickets_page", guild_id, status, fields, after, batch_size)
+            for ticket in page:
+                yield ticket
+            if len(page) < batch_size:
+                return
+            after = self.parse_ticket_id(page[-1]["id"])
+
+    async def get_all_tickets(self) -> list:
+        """Get all tickets from the database."""
+        return [ticket async for ticket in self.iter_tickets()]
+
+    async def close(self):
+        """Close database connections."""
+        if self._connected:
+            await self.engine.close()
+            self._connected = False
@@ -0,0 +1,245 @@
+import time
+import heapq
+import asyncio
+import metrics
+
+
+def format_duration(seconds: float) -> str:
+    """Render a timeout the way it is shown to users, e.g. "2 hours" or "30 minutes"."""
+    if seconds >= 3600 and seconds % 3600 == 0:
+        hours = int(seconds // 3600)
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    minutes = max(1, round(seconds / 60))
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+class _IdleTicket:
+    """What the scheduler knows about one open ticket."""
+    __slots__ = ("ticket_id", "guild_id", "channel_id", "last_activity", "warned_at", "due")
+
+    def __init__(self, ticket_id: str, guild_id: int, channel_id: int, last_activity: float):
+        self.ticket_id = ticket_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.last_activity = last_activity
+        # When the ticket was last warned, if not active since
+        self.warned_at = None
+        # Deadline of this ticket's current heap entry; older entries are stale
+        self.due = None
+
+
+class IdleScheduler:
+    """Warns and then closes tickets that have seen no activity for their guild's idle timeout.
+
+    Every tracked ticket has at most one live entry in a single heap of
+    deadlines, and one task sleeps until the earliest of them, so nothing
+    scans the open tickets. Activity only moves a ticket's last activity
+    forward in memory; when its old deadline comes up the ticket is simply
+    rescheduled. Entries left behind by a changed timeout are skipped when
+    popped.
+
+    Last activity is written to the database in batches every
+    ``flush_interval`` seconds, so a busy channel costs one row update per
+    interval rather than one per message. On startup the schedule is rebuilt
+    from the stored last activity of the open tickets.
+
+    ``warn(ticket, remaining)`` and ``close(ticket)`` are coroutines supplied
+    by the cog; ``is_open(ticket)`` tells whether the ticket is still open in
+    its channel. They run as separate tasks, at most ``concurrency`` at a
+    time, so a slow Discord call never holds up the timer.
+    """
+
+    def __init__(self, db, warn, close, is_open, default_timeout: int = 0,
+                 warning: int = 3600, flush_interval: float = 30.0, concurrency: int = 5):
+        self.db = db
+        self.warn = warn
+        self.close = close
+        self.is_open = is_open
+        self.default_timeout = default_timeout
+        self.warning = warning
+        self.flush_interval = flush_interval
+
+        # Per-guild timeouts in seconds; guilds missing here use the default
+        self.timeouts = {}
+        self._tickets = {}
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._pending = {}
+        self._tasks = []
+        self._actions = set()
+        self._action_slots = asyncio.Semaphore(concurrency)
+
+        self.warned = 0
+        self.closed = 0
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def __contains__(self, ticket_id) -> bool:
+        return str(ticket_id) in self._tickets
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def pending_activity(self) -> int:
+        """Tickets whose activity hasn't been written yet."""
+        return len(self._pending)
+
+    def timeout_for(self, guild_id: int) -> int:
+        """A guild's idle timeout in seconds; 0 means its tickets never go idle."""
+        return self.timeouts.get(guild_id, self.default_timeout)
+
+    async def load(self, guild_ids: set):
+        """Rebuild the schedule for the open tickets of ``guild_ids`` from the database."""
+        self.timeouts = {
+            guild_id: seconds for guild_id, seconds in (await self.db.get_idle_timeouts()).items()
+            if guild_id in guild_ids
+        }
+        tickets = self.db.iter_tickets(status="open", fields=("guild_id", "channel_id", "last_activity", "created_at"))
+        async for ticket in tickets:
+            # Legacy tickets without a guild have no timeout to go by
+            if ticket["guild_id"] not in guild_ids or ticket["channel_id"] is None:
+                continue
+            last_activity = ticket.get("last_activity") or ticket.get("created_at") or time.time()
+            self.track(ticket["id"], ticket["guild_id"], ticket["channel_id"], last_activity)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._flush_periodically())]
+
+    async def stop(self):
+        for task in self._tasks + list(self._actions):
+            task.cancel()
+        self._tasks = []
+        await self.flush()
+
+    def track(self, ticket_id, guild_id: int, channel_id: int, last_activity: float = None):
+        """Start watching an open ticket."""
+        ticket_id = str(ticket_id)
+        ticket = _IdleTicket(ticket_id, guild_id, channel_id, last_activity or time.time())
+        self._tickets[ticket_id] = ticket
+        self._schedule(ticket)
+
+    def forget(self, ticket_id):
+        self._tickets.pop(str(ticket_id), None)
+        self._pending.pop(str(ticket_id), None)
+
+    def touch(self, ticket_id, guild_id: int, channel_id: int, when: float = None):
+        """Record activity in a ticket. Nothing is written until the next flush."""
+        ticket_id = str(ticket_id)
+        when = when or time.time()
+        ticket = self._tickets.get(ticket_id)
+        if ticket is None:
+            self.track(ticket_id, guild_id, channel_id, when)
+        else:
+            ticket.last_activity = when
+            ticket.warned_at = None
+        self._pending[ticket_id] = int(when)
+
+    def set_timeout(self, guild_id: int, seconds):
+        """Change a guild's timeout (None restores the default) and reschedule its tickets."""
+        if seconds is None:
+            self.timeouts.pop(guild_id, None)
+        else:
+            self.timeouts[guild_id] = seconds
+        for ticket in self._tickets.values():
+            if ticket.guild_id == guild_id:
+                self._schedule(ticket)
+
+    async def flush(self):
+        """Write the activity recorded since the last flush in one batch."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self.db.touch_tickets(pending)
+        except Exception as e:
+            metrics.log(f"Failed to record ticket activity: {str(e)}", level="error", tickets=len(pending))
+            # Keep the newer timestamp of anything touched while the write failed
+            for ticket_id, timestamp in pending.items():
+                self._pending.setdefault(ticket_id, timestamp)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _next_action(self, ticket: _IdleTicket):
+        """Return ``(deadline, action)`` for a ticket, or ``(None, None)`` if its guild has no timeout."""
+        timeout = self.timeout_for(ticket.guild_id)
+        if not timeout:
+            return None, None
+        close_at = ticket.last_activity + timeout
+        if ticket.warned_at is not None:
+            # A warning always leaves its full notice, even after downtime
+            return max(close_at, ticket.warned_at + self.warning), "close"
+        if self.warning and self.warning < timeout:
+            return close_at - self.warning, "warn"
+        return close_at, "close"
+
+    def _schedule(self, ticket: _IdleTicket):
+        due, _ = self._next_action(ticket)
+        ticket.due = due
+        if due is None:
+            return
+        if not self._heap or due < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (due, ticket.ticket_id))
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            due, ticket_id = self._heap[0]
+            delay = due - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            ticket = self._tickets.get(ticket_id)
+            if ticket is not None and ticket.due == due:
+                self._fire(ticket)
+
+    def _fire(self, ticket: _IdleTicket):
+        if not self.is_open(ticket):
+            self.forget(ticket.ticket_id)
+            return
+
+        due, action = self._next_action(ticket)
+        if due is None:
+            ticket.due = None
+        elif due > time.time():
+            # Active since this entry was scheduled
+            self._schedule(ticket)
+        elif action == "warn":
+            ticket.warned_at = time.time()
+            self._schedule(ticket)
+            self.warned += 1
+            self._act(ticket, self.warn(ticket, self.warning))
+        else:
+            self.forget(ticket.ticket_id)
+            self.closed += 1
+            self._act(ticket, self.close(ticket))
+
+    def _act(self, ticket: _IdleTicket, action):
+        async def run():
+            async with self._action_slots:
+                try:
+                    await action
+                except Exception as e:
+                    metrics.log(f"Idle handling of ticket {ticket.ticket_id} failed: {str(e)}", level="error",
+                                channel_id=ticket.channel_id)
+
+        task = asyncio.create_task(run())
+        self._actions.add(task)
+        task.add_done_callback(self._actions.discard)
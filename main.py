@@ -1,20 +1,115 @@
-import os
-import nextcord
-from nextcord.ext import commands
-from ticket import TicketBot
-from dotenv import load_dotenv
-
-load_dotenv()
-
-intents = nextcord.Intents.default()
-intents.typing = False
-intents.message_content = True
-intents.presences = False
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-@bot.event
-async def on_ready():
-    print(f'{bot.user.name} has connected to Discord!')
-
-bot.add_cog(TicketBot(bot))
-bot.run(os.getenv("DISCORD_BOT_TOKEN"))
\ No newline at end of file
+import time
+_imports_started = time.perf_counter()
+
+import os
+import signal
+import asyncio
+import nextcord
+from nextcord.ext import commands
+from ticket import TicketBot
+from dotenv import load_dotenv
+import metrics
+
+# Seconds spent importing the bot and its dependencies, reported at startup
+IMPORT_SECONDS = time.perf_counter() - _imports_started
+
+load_dotenv()
+
+
+def shard_count_from_env():
+    """Read SHARD_COUNT: None when unset (no sharding), "auto" or a number of shards."""
+    value = os.getenv("SHARD_COUNT", "").strip().lower()
+    if not value:
+        return None
+    if value == "auto":
+        return "auto"
+    return int(value)
+
+
+def create_bot(shard_ids: list = None, shard_count=None) -> commands.Bot:
+    """Build the bot with the ticket cog.
+
+    Without ``shard_count`` this is a single-connection ``commands.Bot``. With
+    one, an ``AutoShardedBot`` runs ``shard_ids`` (all shards if None) over
+    one gateway connection per shard; ``"auto"`` uses Discord's recommended
+    shard count. Must be called from inside the event loop that runs the bot.
+    """
+    intents = nextcord.Intents.default()
+    intents.typing = False
+    intents.message_content = True
+    intents.presences = False
+
+    if shard_count is None:
+        bot = commands.Bot(command_prefix='!', intents=intents)
+    else:
+        bot = commands.AutoShardedBot(
+            command_prefix='!',
+            intents=intents,
+            shard_ids=shard_ids,
+            shard_count=None if shard_count == "auto" else shard_count
+        )
+
+    @bot.event
+    async def on_ready():
+        if isinstance(bot, commands.AutoShardedBot):
+            metrics.log(f'{bot.user.name} has connected to Discord!', shards=sorted(bot.shards),
+                        shard_count=bot.shard_count, guilds=len(bot.guilds),
+                        since_start=round(time.perf_counter() - _imports_started, 3))
+        else:
+            metrics.log(f'{bot.user.name} has connected to Discord!',
+                        since_start=round(time.perf_counter() - _imports_started, 3))
+
+    bot.add_cog(TicketBot(bot))
+    return bot
+
+
+async def run_bot(token: str, shard_ids: list = None, shard_count=None, ready=None):
+    """Run the bot until SIGINT or SIGTERM, then shut down cleanly.
+
+    Shutdown closes every gateway connection and waits for the cog's storage
+    pool to close, so no query is cut off half way. ``ready`` is called once
+    all of this process's shards are connected.
+    """
+    started = time.perf_counter()
+    bot = create_bot(shard_ids, shard_count)
+    cog = bot.get_cog("TicketBot")
+    metrics.log("Bot created", imports=round(IMPORT_SECONDS, 3), setup=round(time.perf_counter() - started, 3),
+                driver_import=round(cog.db.timings["driver_import"], 3))
+
+    # Storage connects while the bot logs in; commands are answered once it is ready
+    cog.connect_storage()
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows' event loops can't watch signals; a plain handler still runs on the main thread
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+
+    async def notify_ready():
+        await bot.wait_until_ready()
+        if ready is not None:
+            ready()
+
+    runner = asyncio.create_task(bot.start(token))
+    notifier = asyncio.create_task(notify_ready())
+    stopper = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait([runner, stopper], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        notifier.cancel()
+        stopper.cancel()
+        # Closing the bot unloads the cog, which releases the storage pool
+        await bot.close()
+        await cog.wait_closed()
+        if runner.done():
+            # Surface login or gateway errors instead of exiting silently
+            runner.result()
+        else:
+            runner.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_bot(os.getenv("DISCORD_BOT_TOKEN"), shard_count=shard_count_from_env()))
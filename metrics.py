@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+from aiohttp import web
+
+# Latency buckets in seconds, from a fast cache hit to a slow Discord call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# LOG_FORMAT=json switches log lines to one JSON object per line and also
+# emits an event for every timed command, interaction and database call
+JSON_LOGS = os.getenv("LOG_FORMAT", "text").lower() == "json"
+
+
+def log(message: str, level: str = "info", **fields):
+    """Print a log line, as plain text or as JSON depending on LOG_FORMAT."""
+    if JSON_LOGS:
+        print(json.dumps({"ts": time.time(), "level": level, "message": message, **fields}, default=str), flush=True)
+    elif fields:
+        details = " ".join(f"{key}={value}" for key, value in fields.items())
+        print(f"{message} ({details})")
+    else:
+        print(message)
+
+
+def event(kind: str, **fields):
+    """Emit a structured event; a no-op unless JSON logs are enabled."""
+    if JSON_LOGS:
+        print(json.dumps({"ts": time.time(), "event": kind, **fields}, default=str), flush=True)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][index] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series["count"] if series else 0
+
+    def counts(self) -> dict:
+        """Observation counts for every label set, keyed by label-value tuple."""
+        return {key: series["count"] for key, series in self._series.items()}
+
+    def _render_samples(self) -> list:
+        lines = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series["counts"]):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': '+Inf'})} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class Gauge(_Metric):
+    """A gauge whose samples are read from a callback when metrics are scraped.
+
+    The callback returns an iterable of ``(labels, value)`` pairs, so live
+    state such as cache sizes never has to be copied into the registry.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self._values = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def _render_samples(self) -> list:
+        values = dict(self._values)
+        if self.callback is not None:
+            for labels, value in self.callback():
+                values[self._key(labels)] = value
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Registry:
+    """Holds every metric and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = (), callback=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+COMMAND_SECONDS = REGISTRY.histogram(
+    "ticketbot_command_duration_seconds", "Slash command latency.", ("command",))
+COMMAND_ERRORS = REGISTRY.counter(
+    "ticketbot_command_errors_total", "Slash commands that raised.", ("command",))
+COMPONENT_SECONDS = REGISTRY.histogram(
+    "ticketbot_component_duration_seconds", "Button and other component interaction latency.", ("custom_id",))
+DB_SECONDS = REGISTRY.histogram(
+    "ticketbot_db_operation_duration_seconds", "Storage operation latency.", ("backend", "operation"))
+DB_ERRORS = REGISTRY.counter(
+    "ticketbot_db_operation_errors_total", "Storage operations that raised.", ("backend", "operation"))
+DISCORD_REQUESTS = REGISTRY.counter(
+    "ticketbot_discord_requests_total", "Discord API requests by route and outcome.", ("method", "route", "status"))
+DISCORD_SECONDS = REGISTRY.histogram(
+    "ticketbot_discord_request_duration_seconds", "Discord API request latency, including retries.", ("method", "route"))
+RATELIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    "ticketbot_ratelimit_wait_seconds", "Time spent waiting on rate limits, locally paced or imposed by Discord.",
+    ("source", "bucket"))
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "ticketbot_event_loop_lag_seconds", "How late the event loop woke up a sleeping task.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+TRANSCRIPT_SECONDS = REGISTRY.histogram(
+    "ticketbot_transcript_duration_seconds", "Time to archive one ticket transcript.",
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+
+# State gauges; their callbacks are attached by the cog that owns the state
+SETTINGS_CACHE_STATS = REGISTRY.gauge(
+    "ticketbot_settings_cache", "Guild settings cache hits, misses and size.", ("stat",))
+CHANNEL_POOL_STATS = REGISTRY.gauge(
+    "ticketbot_channel_pool", "Pre-created ticket channel pool depth, claims, misses and refill rate.", ("stat",))
+CHANNEL_INDEX_ENTRIES = REGISTRY.gauge(
+    "ticketbot_channel_index_entries", "Open ticket channels in the channel index.")
+DB_POOL_CONNECTIONS = REGISTRY.gauge(
+    "ticketbot_db_pool_connections", "Open connections in the SQL connection pool.", ("backend",))
+TRANSCRIPT_QUEUE = REGISTRY.gauge(
+    "ticketbot_transcript_queue", "Transcripts waiting to be archived, archived and failed.", ("stat",))
+IDLE_TICKETS = REGISTRY.gauge(
+    "ticketbot_idle_tickets", "Tickets watched for inactivity, warned and closed as idle.", ("stat",))
+OUTBOX_INTENTS = REGISTRY.gauge(
+    "ticketbot_outbox_intents", "Journaled ticket requests pending, applied, retried and given up on.", ("stat",))
+
+
+@contextmanager
+def time_db(backend: str, operation: str):
+    """Time a storage operation and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_ERRORS.inc(backend=backend, operation=operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        DB_SECONDS.observe(elapsed, backend=backend, operation=operation)
+        event("db_operation", backend=backend, operation=operation, seconds=round(elapsed, 6))
+
+
+def instrument_http(http):
+    """Wrap a nextcord HTTPClient so every Discord API call is counted and timed."""
+    request = http.request
+
+    async def timed_request(route, **kwargs):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await request(route, **kwargs)
+        except Exception as e:
+            status = str(getattr(e, "status", type(e).__name__))
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            DISCORD_REQUESTS.inc(method=route.method, route=route.path, status=status)
+            DISCORD_SECONDS.observe(elapsed, method=route.method, route=route.path)
+            event("discord_request", method=route.method, route=route.path, status=status, seconds=round(elapsed, 6))
+
+    http.request = timed_request
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    """Sample event-loop lag forever: how much later than requested a sleep returns."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+
+class MetricsServer:
+    """Serves ``/metrics`` in the Prometheus text format on a local port."""
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,245 @@
+import json
+import functools
+import time
+import random
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+# How often finished intents older than the retention period are removed
+PURGE_INTERVAL = 3600
+
+
+class Intent:
+    """One journaled request, applied until it succeeds.
+
+    ``payload`` is JSON-serialisable; handlers record their progress in it
+    with :meth:`Outbox.save`, so a retried intent resumes after the last
+    step that completed instead of repeating it.
+    """
+
+    def __init__(self, key: str, kind: str, payload: dict, attempts: int = 0):
+        self.key = key
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+
+class Deferred(Exception):
+    """Raised by a handler that can't apply an intent in this process yet; retried like any failure."""
+
+
+class Outbox:
+    """A durable local journal of intents, applied in the background with retries.
+
+    :meth:`submit` returns once the intent is committed to a local SQLite
+    file, so callers can answer the user without waiting for the remote
+    database or Discord. Workers then run the handler registered for the
+    intent's kind. A handler that raises, including with :class:`Deferred`,
+    is retried with exponential backoff; after ``max_attempts`` the intent
+    is marked failed. Intents still pending at shutdown or after a crash are
+    picked up again by :meth:`open`. Handlers must therefore be idempotent,
+    keyed on :attr:`Intent.key`.
+    """
+
+    def __init__(self, path: str, handlers: dict, workers: int = 4, max_attempts: int = 10,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0, retention: float = 86400.0):
+        self.path = path
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.retention = retention
+
+        self.connection = None
+        # A single thread owns the journal connection, so writes never interleave
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticketbot-outbox")
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._retries = set()
+        self._last_purge = 0.0
+        # Intents not yet applied or given up on, and an event set whenever there are none
+        self._outstanding = 0
+        self._keys = set()
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+        self.applied = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def pending(self) -> int:
+        """Intents not yet applied or given up on."""
+        return self._outstanding
+
+    def is_pending(self, key: str) -> bool:
+        """Whether the intent ``key`` is queued or being applied in this run."""
+        return key in self._keys
+
+    def _enqueue(self, intent: Intent):
+        self._outstanding += 1
+        self._keys.add(intent.key)
+        self._drained.clear()
+        self._queue.put_nowait(intent)
+
+    def _finished(self, intent: Intent):
+        self._outstanding -= 1
+        self._keys.discard(intent.key)
+        if not self._outstanding:
+            self._drained.set()
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> list:
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        try:
+            return self._load()
+        except Exception:
+            # Leave nothing half-open, so opening can simply be tried again
+            self.connection.close()
+            self.connection = None
+            raise
+
+    def _load(self) -> list:
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        # FULL syncs every commit: an intent the user was told about survives a power loss
+        self.connection.execute("PRAGMA synchronous = FULL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS intents (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_intents_state ON intents (state, updated_at)")
+        rows = self.connection.execute(
+            "SELECT key, kind, payload, attempts FROM intents WHERE state = 'pending' ORDER BY created_at"
+        ).fetchall()
+        return [Intent(key, kind, json.loads(payload), attempts) for key, kind, payload, attempts in rows]
+
+    async def open(self) -> int:
+        """Open the journal and queue every intent left pending by the previous run; does nothing if open."""
+        if self.connection is not None:
+            return 0
+        intents = await self._in_thread(self._open)
+        for intent in intents:
+            self._enqueue(intent)
+        if intents:
+            metrics.log(f"Resuming {len(intents)} pending intents from the outbox")
+        return len(intents)
+
+    def start(self):
+        if self.enabled and not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for handle in self._retries:
+            handle.cancel()
+        self._tasks = []
+        self._retries = set()
+        if self.connection is not None:
+            await self._in_thread(self.connection.close)
+            self.connection = None
+        self._executor.shutdown(wait=False)
+
+    def _insert(self, intent: Intent) -> bool:
+        now = int(time.time())
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO intents (key, kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (intent.key, intent.kind, json.dumps(intent.payload), now, now)
+        )
+        return cursor.rowcount > 0
+
+    async def submit(self, key: str, kind: str, payload: dict) -> Intent:
+        """Journal an intent and queue it; returns once it is durable.
+
+        Submitting a key that is already journaled does nothing, so a
+        repeated request can't be applied twice.
+        """
+        intent = Intent(key, kind, payload)
+        if await self._in_thread(self._insert, intent):
+            self._enqueue(intent)
+        return intent
+
+    def _update(self, key: str, **columns):
+        columns["updated_at"] = int(time.time())
+        self.connection.execute(
+            f"UPDATE intents SET {', '.join(f'{column} = ?' for column in columns)} WHERE key = ?",
+            (*columns.values(), key)
+        )
+
+    async def save(self, intent: Intent):
+        """Persist a handler's progress, recorded in ``intent.payload``."""
+        await self._in_thread(functools.partial(self._update, intent.key, payload=json.dumps(intent.payload)))
+
+    async def join(self):
+        """Wait until every queued intent, including retries, has been applied or given up on."""
+        await self._drained.wait()
+
+    def _purge(self):
+        self.connection.execute(
+            "DELETE FROM intents WHERE state <> 'pending' AND updated_at < ?",
+            (int(time.time() - self.retention),)
+        )
+
+    async def _work(self):
+        while True:
+            intent = await self._queue.get()
+            await self._apply(intent)
+
+    async def _apply(self, intent: Intent):
+        intent.attempts += 1
+        try:
+            await self.handlers[intent.kind](intent)
+        except Exception as e:
+            await self._failed(intent, e)
+            return
+
+        self.applied += 1
+        # Recorded before join() can return, so a drained outbox is also a durable one
+        await self._in_thread(functools.partial(self._update, intent.key, state="done", attempts=intent.attempts))
+        self._finished(intent)
+        if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = time.monotonic()
+            await self._in_thread(self._purge)
+
+    async def _failed(self, intent: Intent, error: Exception):
+        if intent.attempts >= self.max_attempts:
+            self.failed += 1
+            metrics.log(f"Giving up on {intent.kind} intent {intent.key} after {intent.attempts} attempts: {str(error)}",
+                        level="error")
+            await self._in_thread(functools.partial(
+                self._update, intent.key, state="failed", attempts=intent.attempts, last_error=str(error)
+            ))
+            self._finished(intent)
+            return
+
+        self.retried += 1
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (intent.attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        metrics.log(f"Retrying {intent.kind} intent {intent.key} in {delay:.1f}s: {str(error)}", level="warning",
+                    attempts=intent.attempts)
+        await self._in_thread(functools.partial(
+            self._update, intent.key, attempts=intent.attempts, last_error=str(error)
+        ))
+
+        def requeue():
+            self._retries.discard(handle)
+            self._queue.put_nowait(intent)
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
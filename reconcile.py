@@ -0,0 +1,136 @@
+import time
+import nextcord
+import metrics
+from concurrency import RouteRateLimiter
+from restore import RestoreJob
+from channel_pool import POOL_CHANNEL_NAME
+
+# Status given to open tickets whose channel was deleted without /close
+CHANNEL_MISSING = "channel_missing"
+
+
+class Reconciliation:
+    """Brings one guild's open tickets and its ticket channels back in line.
+
+    Channels are read from the cached guild state, so the diff itself makes
+    no API calls; tickets are streamed from the database. Only the
+    differences cost anything:
+
+    - a ticket without a recorded channel is linked to its channel if one
+      with its ID in the name exists, otherwise the channel is recreated
+    - a ticket whose recorded channel is gone is marked ``channel_missing``
+    - a channel in the ticket category that no open ticket owns is reported
+      as an orphan and left alone
+
+    Legacy tickets without a guild are only linked by name, never marked or
+    recreated, because they may belong to another guild. Nor is a ticket
+    for which ``in_flight(ticket)`` is true: its channel is still being
+    created.
+    """
+
+    def __init__(self, bot, db, guild: nextcord.Guild, category: nextcord.CategoryChannel,
+                 rate_limiter: RouteRateLimiter, concurrency: int = 5, in_flight=None):
+        self.bot = bot
+        self.db = db
+        self.guild = guild
+        self.category = category
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.in_flight = in_flight or (lambda ticket: False)
+
+        self.matched = 0
+        self.linked = 0
+        self.marked = []
+        self.orphans = []
+        self.restore = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self):
+        self.started_at = time.monotonic()
+        try:
+            await self._run()
+        finally:
+            self.finished_at = time.monotonic()
+
+    async def _run(self):
+        unmatched = {
+            channel.id: channel
+            for channel in self.category.text_channels
+            if channel.name != POOL_CHANNEL_NAME
+        }
+        without_channel = []
+
+        tickets = self.db.iter_tickets(guild_id=self.guild.id, status="open",
+                                       fields=("guild_id", "creator_id", "channel_id", "ticket_type", "intent_key"))
+        async for ticket in tickets:
+            channel_id = ticket["channel_id"]
+            if channel_id is None:
+                without_channel.append(ticket)
+            elif self.guild.get_channel(channel_id) is not None:
+                unmatched.pop(channel_id, None)
+                self.db.channel_index.add(channel_id, ticket["id"])
+                self.matched += 1
+            elif ticket["guild_id"] == self.guild.id:
+                await self.db.set_ticket_status(ticket["id"], CHANNEL_MISSING)
+                self.marked.append(str(ticket["id"]))
+
+        # Channels made before channel IDs were recorded carry the ticket ID in their name
+        by_ticket_id = {channel.name.rsplit('-', 1)[-1]: channel for channel in unmatched.values()}
+        to_restore = []
+        for ticket in without_channel:
+            channel = by_ticket_id.get(str(ticket["id"]))
+            if channel is not None and channel.id in unmatched:
+                await self.db.set_ticket_channel(ticket["id"], channel.id)
+                del unmatched[channel.id]
+                self.linked += 1
+            elif ticket["guild_id"] == self.guild.id and not self.in_flight(ticket):
+                to_restore.append(ticket)
+
+        self.orphans = list(unmatched.values())
+
+        if to_restore:
+            self.restore = RestoreJob(self.bot, self.db, self.guild, self.category,
+                                      self.rate_limiter, self.concurrency, self.in_flight)
+            await self.restore.run(to_restore)
+
+    @property
+    def changes(self) -> int:
+        """Number of differences found."""
+        restored = self.restore.processed if self.restore else 0
+        return self.linked + len(self.marked) + len(self.orphans) + restored
+
+    def summary(self) -> str:
+        """Report shown by /reconcile and logged after startup."""
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        restore = self.restore
+        lines = [
+            f"Reconciled tickets in {elapsed:.1f}s: {self.matched} in place, {self.linked} relinked, "
+            f"{restore.created if restore else 0} channels recreated, "
+            f"{len(self.marked)} marked as missing their channel, {len(self.orphans)} orphaned channels."
+        ]
+        if restore and restore.failed:
+            lines.append(f"{restore.failed} channels could not be recreated:")
+            lines.extend(f"- {error}" for error in restore.errors)
+        if self.marked:
+            lines.append(f"Tickets missing their channel: {', '.join(self.marked[:20])}"
+                         f"{' ...' if len(self.marked) > 20 else ''}")
+        if self.orphans:
+            lines.append(f"Channels without an open ticket: {', '.join(c.mention for c in self.orphans[:20])}"
+                         f"{' ...' if len(self.orphans) > 20 else ''}")
+        return "\n".join(lines)
+
+    def log(self):
+        metrics.log(
+            f"Reconciled guild {self.guild.id}",
+            matched=self.matched,
+            linked=self.linked,
+            recreated=self.restore.created if self.restore else 0,
+            failed=self.restore.failed if self.restore else 0,
+            marked=len(self.marked),
+            orphans=len(self.orphans)
+        )
@@ -0,0 +1,130 @@
+import time
+import nextcord
+import metrics
+from concurrency import RouteRateLimiter, run_bounded
+
+
+class RestoreJob:
+    """Recreates the channels for a guild's stored tickets.
+
+    Channels are created by a bounded pool of workers that pace themselves
+    with a :class:`RouteRateLimiter`, and each new channel is recorded on its
+    ticket. Tickets whose recorded channel (or ``ticket-<id>`` channel) still
+    exists are skipped, so running the job again after an interruption
+    resumes where it stopped instead of duplicating channels. So are tickets
+    for which ``in_flight(ticket)`` is true: their channel is still being
+    created by the request that opened them.
+    """
+
+    def __init__(self, bot, db, guild: nextcord.Guild, category: nextcord.CategoryChannel,
+                 rate_limiter: RouteRateLimiter, concurrency: int = 5, in_flight=None):
+        self.bot = bot
+        self.db = db
+        self.guild = guild
+        self.category = category
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.in_flight = in_flight or (lambda ticket: False)
+
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+
+        # Channels restored by an earlier, interrupted run
+        self.existing = {channel.name for channel in category.text_channels}
+
+    @property
+    def processed(self) -> int:
+        return self.created + self.skipped + self.failed
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self, tickets):
+        """Restore every ticket in ``tickets`` (a list or async iterable)."""
+        self.started_at = time.monotonic()
+        try:
+            await run_bounded(tickets, self._restore, self.concurrency)
+        finally:
+            self.finished_at = time.monotonic()
+
+    async def _restore(self, ticket: dict):
+        ticket_id = str(ticket["id"])
+        channel_name = f"ticket-{ticket_id}"
+        channel_id = ticket.get("channel_id")
+        if channel_name in self.existing or (channel_id and self.guild.get_channel(channel_id)):
+            self.skipped += 1
+            return
+        if self.in_flight(ticket):
+            self.skipped += 1
+            return
+
+        try:
+            user = await self._get_user(ticket["creator_id"])
+        except nextcord.NotFound:
+            # The creator's account no longer exists
+            self.skipped += 1
+            return
+        except Exception as e:
+            self._fail(ticket_id, e)
+            return
+
+        overwrites = {
+            self.guild.default_role: nextcord.PermissionOverwrite(read_messages=False),
+            user: nextcord.PermissionOverwrite(read_messages=True, send_messages=True),
+            self.guild.me: nextcord.PermissionOverwrite(read_messages=True, send_messages=True, manage_channels=True)
+        }
+
+        try:
+            await self.rate_limiter.acquire("create_channel", self.guild.id)
+            ticket_channel = await self.guild.create_text_channel(
+                channel_name,
+                overwrites=overwrites,
+                category=self.category,
+                topic=f"Ticket for {user.name} (ID: {ticket_id})"
+            )
+            self.existing.add(channel_name)
+            await self.db.set_ticket_channel(ticket_id, ticket_channel.id)
+
+            await self.rate_limiter.acquire("send_message", ticket_channel.id)
+            await ticket_channel.send(f"🎫 {user.mention}, this is your support ticket (ID: {ticket_id}). Please describe your issue here.")
+            self.created += 1
+        except Exception as e:
+            self._fail(ticket_id, e)
+
+    async def _get_user(self, user_id: int):
+        user = self.bot.get_user(user_id)
+        if user is None:
+            await self.rate_limiter.acquire("fetch_user")
+            user = await self.bot.fetch_user(user_id)
+        return user
+
+    def _fail(self, ticket_id: str, error: Exception):
+        self.failed += 1
+        metrics.log(f"Failed to restore ticket {ticket_id}: {str(error)}", level="error", guild_id=self.guild.id)
+        if len(self.errors) < 5:
+            self.errors.append(f"{ticket_id}: {error}")
+
+    def progress(self, total: int = None) -> str:
+        """One-line progress report for the /load response."""
+        of_total = f"/{total}" if total is not None else ""
+        return (f"Loading tickets... {self.processed}{of_total} processed "
+                f"({self.created} created, {self.skipped} skipped, {self.failed} failed)")
+
+    def summary(self) -> str:
+        """Final report shown once the job has finished."""
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        lines = [
+            f"Finished loading tickets in {elapsed:.1f}s: "
+            f"{self.created} created, {self.skipped} skipped, {self.failed} failed."
+        ]
+        if self.errors:
+            lines.append("First errors:")
+            lines.extend(f"- {error}" for error in self.errors)
+        if self.failed:
+            lines.append("Run /load again to retry the failed tickets.")
+        return "\n".join(lines)
@@ -0,0 +1,393 @@
+"""Versioned schema and index migrations for every storage backend.
+
+Each backend records the migrations it has applied (``schema_migrations``
+table or collection) and only runs the newer ones on startup. Every
+migration is also written to be safe to run twice, because databases
+created by older releases have tables but no migration history.
+"""
+import time
+import metrics
+
+# pymongo.ASCENDING; the MongoDB driver is only imported when that backend is used
+ASCENDING = 1
+
+
+# --------------------------------------------------------------------------- #
+# SQL (SQLite / MySQL)
+#
+# Migrations receive the engine, for its dialect helpers and column types,
+# and an open cursor. Column types are written as {placeholders} filled in
+# from engine.types.
+# --------------------------------------------------------------------------- #
+
+def _sql_create_base_tables(engine, cursor):
+    # Create tickets table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tickets (
+            id {pk},
+            creator_id {bigint} NOT NULL,
+            users {text} NOT NULL
+        )
+    """.format(**engine.types))
+
+    # Create settings table for storing category IDs
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            guild_id {bigint} PRIMARY KEY,
+            ticket_category_id {bigint}
+        )
+    """.format(**engine.types))
+
+
+def _sql_add_guild_and_status(engine, cursor):
+    engine._add_column(cursor, "tickets", "guild_id", "{bigint} NULL".format(**engine.types))
+    engine._add_column(cursor, "tickets", "status", "{status} NOT NULL DEFAULT 'open'".format(**engine.types))
+
+
+def _sql_create_ticket_users(engine, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_users (
+            ticket_id {int} NOT NULL,
+            user_id {bigint} NOT NULL,
+            PRIMARY KEY (ticket_id, user_id)
+        )
+    """.format(**engine.types))
+    engine._create_index(cursor, "idx_ticket_users_user_id", "ticket_users", ("user_id",))
+
+    # Copy the legacy comma-joined users column into the membership table
+    cursor.execute("SELECT id, users FROM tickets")
+    rows = [engine._row_to_dict(cursor, row) for row in cursor.fetchall()]
+    members = [
+        (row["id"], int(user))
+        for row in rows
+        for user in set(row["users"].split(','))
+        if user
+    ]
+    if members:
+        cursor.executemany(
+            engine._sql(f"{engine.insert_ignore} INTO ticket_users (ticket_id, user_id) VALUES (?, ?)"),
+            members
+        )
+
+
+def _sql_add_channel_and_created_at(engine, cursor):
+    engine._add_column(cursor, "tickets", "channel_id", "{bigint} NULL".format(**engine.types))
+    engine._add_column(cursor, "tickets", "created_at", "{bigint} NULL".format(**engine.types))
+
+    # Rows from before creation times were recorded start their clock now
+    cursor.execute(engine._sql("UPDATE tickets SET created_at = ? WHERE created_at IS NULL"), (int(time.time()),))
+
+    # With a single configured guild, legacy tickets can only belong to it
+    cursor.execute("SELECT guild_id FROM settings")
+    guilds = [engine._row_to_dict(cursor, row)["guild_id"] for row in cursor.fetchall()]
+    if len(guilds) == 1:
+        cursor.execute(engine._sql("UPDATE tickets SET guild_id = ? WHERE guild_id IS NULL"), (guilds[0],))
+
+
+def _sql_create_ticket_indexes(engine, cursor):
+    engine._create_index(cursor, "idx_tickets_guild_status", "tickets", ("guild_id", "status"))
+    engine._create_index(cursor, "idx_tickets_creator_id", "tickets", ("creator_id",))
+    engine._create_index(cursor, "idx_tickets_channel_id", "tickets", ("channel_id",), unique=True)
+
+
+def _sql_create_transcripts(engine, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transcripts (
+            id {pk},
+            ticket_id {key} NOT NULL,
+            guild_id {bigint} NULL,
+            channel_id {bigint} NOT NULL,
+            path {text} NOT NULL,
+            message_count {int} NOT NULL,
+            size_bytes {bigint} NOT NULL,
+            created_at {bigint} NOT NULL
+        )
+    """.format(**engine.types))
+    engine._create_index(cursor, "idx_transcripts_guild_ticket", "transcripts", ("guild_id", "ticket_id"))
+
+
+def _sql_add_idle_tracking(engine, cursor):
+    engine._add_column(cursor, "settings", "idle_timeout", "{int} NULL".format(**engine.types))
+    engine._add_column(cursor, "tickets", "last_activity", "{bigint} NULL".format(**engine.types))
+    cursor.execute("UPDATE tickets SET last_activity = created_at WHERE last_activity IS NULL")
+    # Lets the idle scheduler load open tickets ordered by when they go idle
+    engine._create_index(cursor, "idx_tickets_status_activity", "tickets", ("status", "last_activity"))
+
+
+def _sql_create_ticket_stats(engine, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_stats (
+            guild_id {bigint} PRIMARY KEY,
+            open_tickets {int} NOT NULL DEFAULT 0,
+            created_total {int} NOT NULL DEFAULT 0,
+            closed_total {int} NOT NULL DEFAULT 0
+        )
+    """.format(**engine.types))
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_user_stats (
+            guild_id {bigint} NOT NULL,
+            user_id {bigint} NOT NULL,
+            open_tickets {int} NOT NULL DEFAULT 0,
+            created_total {int} NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )
+    """.format(**engine.types))
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_daily_stats (
+            guild_id {bigint} NOT NULL,
+            day {bigint} NOT NULL,
+            created {int} NOT NULL DEFAULT 0,
+            closed {int} NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day)
+        )
+    """.format(**engine.types))
+    # Count the tickets that existed before counting began
+    engine._rebuild_stats(cursor, totals=True)
+
+
+def _sql_add_intent_key(engine, cursor):
+    engine._add_column(cursor, "tickets", "intent_key", "{key} NULL".format(**engine.types))
+    engine._create_index(cursor, "idx_tickets_intent_key", "tickets", ("intent_key",), unique=True)
+
+
+def _sql_create_ticket_types(engine, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_types (
+            guild_id {bigint} NOT NULL,
+            name {key} NOT NULL,
+            label {text} NOT NULL,
+            prefix {key} NOT NULL,
+            emoji {key} NOT NULL,
+            category_id {bigint} NULL,
+            staff_role_ids {text} NULL,
+            max_open {int} NULL,
+            position {int} NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, name)
+        )
+    """.format(**engine.types))
+    # Existing tickets were all opened from the support button or /ticket
+    engine._add_column(cursor, "tickets", "ticket_type", "{key} NULL".format(**engine.types))
+
+
+SQL_MIGRATIONS = [
+    (1, "create tickets and settings tables", _sql_create_base_tables),
+    (2, "add guild_id and status to tickets", _sql_add_guild_and_status),
+    (3, "move ticket members into ticket_users", _sql_create_ticket_users),
+    (4, "add channel_id and created_at to tickets", _sql_add_channel_and_created_at),
+    (5, "index tickets by guild/status, creator and channel", _sql_create_ticket_indexes),
+    (6, "create transcripts table", _sql_create_transcripts),
+    (7, "add idle timeout and ticket last activity", _sql_add_idle_tracking),
+    (8, "create per-guild ticket statistics", _sql_create_ticket_stats),
+    (9, "add idempotency key to tickets", _sql_add_intent_key),
+    (10, "create per-guild ticket types", _sql_create_ticket_types),
+]
+
+
+def migrate_sql(connection, engine) -> list:
+    """Apply pending SQL migrations on ``connection``; returns the versions applied."""
+    cursor = engine._cursor(connection)
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version {int} PRIMARY KEY,
+                description {text} NOT NULL,
+                applied_at {bigint} NOT NULL
+            )
+        """.format(**engine.types))
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {engine._row_to_dict(cursor, row)["version"] for row in cursor.fetchall()}
+        connection.commit()
+
+        ran = []
+        for version, description, migration in SQL_MIGRATIONS:
+            if version in applied:
+                continue
+            migration(engine, cursor)
+            cursor.execute(
+                engine._sql(f"{engine.insert_ignore} INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)"),
+                (version, description, int(time.time()))
+            )
+            connection.commit()
+            metrics.log(f"Applied {engine.name} schema migration {version}: {description}")
+            ran.append(version)
+        return ran
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# --------------------------------------------------------------------------- #
+# MongoDB
+#
+# Migrations receive the pymongo Database and run in a worker thread.
+# --------------------------------------------------------------------------- #
+
+def _mongo_unique_guild_settings(db):
+    # Racing upserts may have left duplicate settings documents; keep the newest
+    duplicates = db.settings.aggregate([
+        {"$sort": {"_id": -1}},
+        {"$group": {"_id": "$guild_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    for duplicate in duplicates:
+        db.settings.delete_many({"_id": {"$in": duplicate["ids"][1:]}})
+
+    db.settings.create_index([("guild_id", ASCENDING)], unique=True, name="guild_id_unique")
+
+
+def _mongo_backfill_ticket_fields(db):
+    from pymongo import UpdateOne
+
+    # created_at comes from the ObjectId, which records the insert time
+    batch = []
+    for document in db.tickets.find({"created_at": {"$exists": False}}, {"_id": 1}):
+        batch.append(UpdateOne(
+            {"_id": document["_id"]},
+            {"$set": {"created_at": int(document["_id"].generation_time.timestamp())}}
+        ))
+        if len(batch) >= 1000:
+            db.tickets.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        db.tickets.bulk_write(batch, ordered=False)
+
+    db.tickets.update_many({"status": {"$exists": False}}, {"$set": {"status": "open"}})
+    db.tickets.update_many({"channel_id": {"$exists": False}}, {"$set": {"channel_id": None}})
+
+    # With a single configured guild, legacy tickets can only belong to it
+    guilds = db.settings.distinct("guild_id")
+    if len(guilds) == 1:
+        db.tickets.update_many({"guild_id": None}, {"$set": {"guild_id": guilds[0]}})
+
+
+def _mongo_create_ticket_indexes(db):
+    db.tickets.create_index([("guild_id", ASCENDING), ("status", ASCENDING)], name="guild_status")
+    db.tickets.create_index([("creator_id", ASCENDING)], name="creator_id")
+    db.tickets.create_index([("users", ASCENDING)], name="users")
+    db.tickets.create_index(
+        [("channel_id", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"channel_id": {"$type": "number"}},
+        name="channel_id_unique"
+    )
+
+
+def _mongo_create_transcript_indexes(db):
+    db.transcripts.create_index([("guild_id", ASCENDING), ("ticket_id", ASCENDING)], name="guild_ticket")
+
+
+def _mongo_add_idle_tracking(db):
+    db.tickets.update_many(
+        {"last_activity": {"$exists": False}},
+        [{"$set": {"last_activity": "$created_at"}}]
+    )
+    db.tickets.create_index([("status", ASCENDING), ("last_activity", ASCENDING)], name="status_last_activity")
+
+
+def rebuild_mongodb_ticket_stats(db, guild_id=None, totals: bool = False):
+    """Recount open tickets per guild and creator with an aggregation pipeline.
+
+    Closed tickets are deleted, so cumulative totals can't be recounted;
+    ``totals`` seeds them from the stored tickets.
+    """
+    match = {"guild_id": guild_id} if guild_id is not None else {"guild_id": {"$type": "number"}}
+    counts = db.tickets.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"guild_id": "$guild_id", "creator_id": "$creator_id"},
+            "open_tickets": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$status", "open"]}, "open"]}, 1, 0]}},
+            "created_total": {"$sum": 1}
+        }}
+    ])
+    fields = ("open_tickets", "created_total") if totals else ("open_tickets",)
+
+    db.ticket_stats.update_many(match, {"$set": {"open_tickets": 0}})
+    db.ticket_user_stats.update_many(match, {"$set": {"open_tickets": 0}})
+    guilds = {}
+    for row in counts:
+        key = row["_id"]
+        db.ticket_user_stats.update_one(
+            {"guild_id": key["guild_id"], "user_id": key["creator_id"]},
+            {"$set": {field: row[field] for field in fields}},
+            upsert=True
+        )
+        guild = guilds.setdefault(key["guild_id"], dict.fromkeys(fields, 0))
+        for field in fields:
+            guild[field] += row[field]
+    for guild_id, values in guilds.items():
+        db.ticket_stats.update_one({"guild_id": guild_id}, {"$set": values}, upsert=True)
+
+    if totals:
+        days = db.tickets.aggregate([
+            {"$match": dict(match, created_at={"$type": "number"})},
+            {"$group": {
+                "_id": {
+                    "guild_id": "$guild_id",
+                    "day": {"$subtract": ["$created_at", {"$mod": ["$created_at", 86400]}]}
+                },
+                "created": {"$sum": 1}
+            }}
+        ])
+        for row in days:
+            db.ticket_daily_stats.update_one(
+                {"guild_id": row["_id"]["guild_id"], "day": row["_id"]["day"]},
+                {"$set": {"created": row["created"]}},
+                upsert=True
+            )
+
+
+def _mongo_create_ticket_stats(db):
+    db.ticket_stats.create_index([("guild_id", ASCENDING)], unique=True, name="guild_id_unique")
+    db.ticket_user_stats.create_index([("guild_id", ASCENDING), ("user_id", ASCENDING)], unique=True,
+                                      name="guild_user_unique")
+    db.ticket_daily_stats.create_index([("guild_id", ASCENDING), ("day", ASCENDING)], unique=True,
+                                       name="guild_day_unique")
+    # Count the tickets that existed before counting began
+    rebuild_mongodb_ticket_stats(db, totals=True)
+
+
+def _mongo_create_intent_key_index(db):
+    db.tickets.create_index(
+        [("intent_key", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"intent_key": {"$type": "string"}},
+        name="intent_key_unique"
+    )
+
+
+def _mongo_create_ticket_type_indexes(db):
+    db.ticket_types.create_index([("guild_id", ASCENDING), ("name", ASCENDING)], unique=True,
+                                 name="guild_name_unique")
+
+
+MONGODB_MIGRATIONS = [
+    (1, "unique index on settings.guild_id", _mongo_unique_guild_settings),
+    (2, "backfill guild_id, status, channel_id and created_at on tickets", _mongo_backfill_ticket_fields),
+    (3, "index tickets by guild/status, creator, members and channel", _mongo_create_ticket_indexes),
+    (4, "index transcripts by guild and ticket", _mongo_create_transcript_indexes),
+    (5, "backfill and index ticket last activity", _mongo_add_idle_tracking),
+    (6, "create per-guild ticket statistics", _mongo_create_ticket_stats),
+    (7, "unique index on tickets.intent_key", _mongo_create_intent_key_index),
+    (8, "unique index on ticket_types.guild_id/name", _mongo_create_ticket_type_indexes),
+]
+
+
+def migrate_mongodb(db) -> list:
+    """Apply pending MongoDB migrations to ``db``; returns the versions applied."""
+    applied = {document["_id"] for document in db.schema_migrations.find({}, {"_id": 1})}
+
+    ran = []
+    for version, description, migration in MONGODB_MIGRATIONS:
+        if version in applied:
+            continue
+        migration(db)
+        db.schema_migrations.update_one(
+            {"_id": version},
+            {"$setOnInsert": {"description": description, "applied_at": int(time.time())}},
+            upsert=True
+        )
+        metrics.log(f"Applied mongodb schema migration {version}: {description}")
+        ran.append(version)
+    return ran
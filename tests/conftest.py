@@ -0,0 +1,47 @@
+import os
+import sys
+import contextlib
+import pytest
+
+# The bot's modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def running_cog(monkeypatch, tmp_path):
+    """Start a :class:`ticket.TicketBot` on a fresh SQLite file against the benchmark's fake Discord.
+
+    Yields ``(cog, guild, user)``; keyword arguments override environment
+    settings. Background features are off unless a test turns them on.
+    """
+    import benchmark
+    import ticket
+
+    monkeypatch.setenv("DATABASE_TYPE", "sqlite")
+    monkeypatch.setenv("DATABASE_NAME", str(tmp_path / "tickets.db"))
+    for name, value in {"OUTBOX_PATH": "", "TRANSCRIPT_DIR": "", "TICKET_POOL_SIZE": "0",
+                        "RECONCILE_ON_READY": "false", "IDLE_TIMEOUT_HOURS": "0"}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(ticket, "CLOSE_DELAY", 0)
+
+    @contextlib.asynccontextmanager
+    async def start(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        api = benchmark.FakeDiscord(0.0, 0.0, {}, 1)
+        bot = benchmark.FakeBot(api)
+        guild = benchmark.FakeGuild(api, api.next_id(), bot.user)
+        bot.guilds.append(guild)
+        user = benchmark.FakeUser(api.next_id(), "user")
+        bot.users[user.id] = user
+        cog = ticket.TicketBot(bot)
+        guild.on_channel_delete = cog.on_guild_channel_delete
+        try:
+            await cog.on_ready()
+            await cog.wait_until_ready()
+            yield cog, guild, user
+        finally:
+            cog.cog_unload()
+            await cog.wait_closed()
+
+    return start
@@ -0,0 +1,83 @@
+import asyncio
+import nextcord
+from cache import MISSING
+from databases import DatabaseManager
+
+
+def count_calls(monkeypatch, engine, operation: str) -> list:
+    """Count calls of an engine operation, which is what reaches the database."""
+    calls = []
+    original = getattr(engine, operation)
+
+    async def counted(*args):
+        calls.append(args)
+        return await original(*args)
+    monkeypatch.setattr(engine, operation, counted)
+    return calls
+
+
+def test_repeated_category_reads_are_served_from_the_cache(tmp_path, monkeypatch):
+    async def main():
+        db = DatabaseManager("sqlite", str(tmp_path / "tickets.db"))
+        queries = count_calls(monkeypatch, db.engine, "get_ticket_category")
+        try:
+            results = [await db.get_ticket_category(1) for _ in range(5)]
+        finally:
+            await db.close()
+        return db.settings_cache.stats(), queries, results
+
+    stats, queries, results = asyncio.run(main())
+    assert results == [None] * 5
+    assert len(queries) == 1
+    assert stats["misses"] == 1
+    assert stats["hits"] == 4
+
+
+def test_setting_the_category_writes_through(tmp_path, monkeypatch):
+    async def main():
+        db = DatabaseManager("sqlite", str(tmp_path / "tickets.db"))
+        queries = count_calls(monkeypatch, db.engine, "get_ticket_category")
+        try:
+            await db.get_ticket_category(1)
+            await db.set_ticket_category(1, 42)
+            category_id = await db.get_ticket_category(1)
+        finally:
+            await db.close()
+        return category_id, queries
+
+    category_id, queries = asyncio.run(main())
+    assert category_id == 42
+    assert len(queries) == 1
+
+
+def test_opening_tickets_makes_no_settings_queries(running_cog, monkeypatch):
+    async def main():
+        async with running_cog(MAX_OPEN_TICKETS_PER_USER=0) as (cog, guild, user):
+            await cog.get_or_create_ticket_category(guild)
+            queries = count_calls(monkeypatch, cog.db.engine, "get_ticket_category")
+            misses = cog.db.settings_cache.misses
+            support = cog.ticket_types.get(guild.id, "support")
+            for _ in range(3):
+                await cog._open_ticket(guild, user, support)
+            return queries, cog.db.settings_cache.misses - misses
+
+    queries, misses = asyncio.run(main())
+    assert queries == []
+    assert misses == 0
+
+
+def test_deleting_the_category_invalidates_it(running_cog, monkeypatch):
+    import benchmark
+    # The fake category stands in for nextcord's
+    monkeypatch.setattr(nextcord, "CategoryChannel", benchmark.FakeCategory)
+
+    async def main():
+        async with running_cog() as (cog, guild, user):
+            category = await cog.get_or_create_ticket_category(guild)
+            cached = cog.db.settings_cache.peek(guild.id)
+            await category.delete()
+            return category.id, cached, cog.db.settings_cache.peek(guild.id)
+
+    category_id, cached, after = asyncio.run(main())
+    assert cached == category_id
+    assert after is MISSING
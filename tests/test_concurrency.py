@@ -0,0 +1,26 @@
+import asyncio
+from concurrency import RouteRateLimiter
+
+
+def test_refilled_buckets_are_pruned():
+    async def main():
+        limiter = RouteRateLimiter({"send_message": (2, 0.05)})
+        for channel_id in range(100):
+            await limiter.acquire("send_message", channel_id)
+        # Empty, so dropping it would forget that it has to wait
+        await limiter.acquire("send_message", 0)
+
+        sizes = [len(limiter)]
+        limiter.prune()
+        sizes.append(len(limiter))
+        assert ("send_message", 0) in limiter._buckets
+
+        await asyncio.sleep(0.1)
+        limiter.prune()
+        sizes.append(len(limiter))
+        return sizes
+
+    before, after_use, after_refill = asyncio.run(main())
+    assert before == 100
+    assert after_use >= 1
+    assert after_refill == 0
@@ -0,0 +1,321 @@
+import time
+import sqlite3
+import asyncio
+import threading
+import pytest
+import schema
+from databases import DatabaseManager, PoolConfig, SQLiteWriter
+
+# How long the fake store blocks its worker thread per query
+QUERY_SECONDS = 0.5
+
+# Ticker period; a blocked loop would stop it for the whole query
+TICK_SECONDS = 0.01
+
+
+class SlowCollection:
+    """Stands in for a pymongo collection whose round-trips are slow and blocking."""
+
+    def find_one(self, query, *args, **kwargs):
+        time.sleep(QUERY_SECONDS)
+        return {"guild_id": query["guild_id"], "ticket_category_id": 42}
+
+
+def slow_mongodb(tmp_path):
+    db = DatabaseManager("mongodb", "tickets", mongodb_connection_string="mongodb://localhost",
+                         pool_config=PoolConfig(max_size=2))
+    db.engine.settings_collection = SlowCollection()
+    # The fake collection needs no connection or migrations
+    db._connected = True
+    return db
+
+
+def slow_sqlite(tmp_path):
+    db = DatabaseManager("sqlite", str(tmp_path / "tickets.db"), pool_config=PoolConfig(max_size=2))
+    transaction = db.engine._transaction
+
+    def slow_transaction(connection, func, *args):
+        time.sleep(QUERY_SECONDS)
+        return transaction(connection, func, *args)
+    db.engine._transaction = slow_transaction
+    return db
+
+
+async def ticks_during(coroutine) -> tuple:
+    """Run ``coroutine`` while a ticker runs; returns its result, the ticks and the largest gap between them."""
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(TICK_SECONDS)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    try:
+        result = await coroutine
+    finally:
+        task.cancel()
+    gaps = [later - earlier for earlier, later in zip(ticks, ticks[1:])]
+    return result, len(ticks), max(gaps, default=0.0)
+
+
+@pytest.mark.parametrize("make_db", [slow_mongodb, slow_sqlite], ids=["mongodb", "sqlite"])
+def test_loop_stays_responsive_during_slow_query(tmp_path, make_db):
+    async def main():
+        db = make_db(tmp_path)
+        if db.database_type == "sqlite":
+            await db.connect()
+        try:
+            started = time.perf_counter()
+            _, ticks, largest_gap = await ticks_during(db.get_ticket_category(1))
+            elapsed = time.perf_counter() - started
+        finally:
+            await db.close()
+        return elapsed, ticks, largest_gap
+
+    elapsed, ticks, largest_gap = asyncio.run(main())
+
+    # The query really was slow, and the loop kept ticking all the way through it
+    assert elapsed >= QUERY_SECONDS
+    assert ticks >= (QUERY_SECONDS / TICK_SECONDS) / 2
+    assert largest_gap < QUERY_SECONDS / 2
+
+
+def test_mongodb_pages_fill_missing_fields(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    import pymongo
+    monkeypatch.setattr(pymongo, "MongoClient", mongomock.MongoClient)
+
+    async def main():
+        db = DatabaseManager("mongodb", "tickets", mongodb_connection_string="mongodb://localhost", mongodb_tls=False)
+        await db.connect()
+        # Written before guild_id and channel_id existed, and never backfilled
+        db.engine.collection.insert_one({"creator_id": 5, "users": [5], "status": "open"})
+        try:
+            await db.warm_channel_index({1})
+            return [ticket async for ticket in db.iter_tickets(status="open", fields=("guild_id", "channel_id"))]
+        finally:
+            await db.close()
+
+    tickets = asyncio.run(main())
+    assert tickets[0]["guild_id"] is None
+    assert tickets[0]["channel_id"] is None
+
+
+def test_only_open_channelless_tickets_of_the_guild_are_linked_by_name(tmp_path):
+    async def main():
+        db = DatabaseManager("sqlite", str(tmp_path / "tickets.db"))
+        try:
+            ours = await db.create_ticket(5, guild_id=1)
+            theirs = await db.create_ticket(5, guild_id=2)
+            closed = await db.create_ticket(5, guild_id=1)
+            await db.set_ticket_status(closed, "channel_missing")
+            linked = await db.create_ticket(5, guild_id=1)
+            await db.set_ticket_channel(linked, 300)
+
+            results = [
+                await db.link_ticket_channel(1, theirs, 101),
+                await db.link_ticket_channel(1, closed, 102),
+                await db.link_ticket_channel(1, linked, 103),
+                await db.link_ticket_channel(1, ours, 104)
+            ]
+            return results, ours, db.ticket_for_channel(101), db.ticket_for_channel(104)
+        finally:
+            await db.close()
+
+    results, ours, foreign, claimed = asyncio.run(main())
+    assert results == [False, False, False, True]
+    assert foreign is None
+    assert claimed == str(ours)
+
+
+def open_writer(tmp_path) -> SQLiteWriter:
+    def connect():
+        connection = sqlite3.connect(str(tmp_path / "writes.db"), check_same_thread=False, isolation_level=None)
+        connection.execute("CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY)")
+        return connection
+    writer = SQLiteWriter(connect)
+    writer.open()
+    return writer
+
+
+def insert(cursor, item_id: int):
+    cursor.execute("INSERT INTO items (id) VALUES (?)", (item_id,))
+    return item_id
+
+
+def insert_then_fail(cursor, item_id: int):
+    insert(cursor, item_id)
+    raise ValueError(f"write {item_id} failed")
+
+
+def stored_items(tmp_path) -> list:
+    with sqlite3.connect(str(tmp_path / "writes.db")) as connection:
+        return [row[0] for row in connection.execute("SELECT id FROM items ORDER BY id")]
+
+
+def test_concurrent_writes_share_one_commit(tmp_path):
+    async def main():
+        writer = open_writer(tmp_path)
+        writes = [asyncio.create_task(writer.run(insert, item_id)) for item_id in range(20)]
+        # Queue every write before the thread takes the first one
+        await asyncio.sleep(0)
+        writer.start()
+        results = await asyncio.gather(*writes)
+        await writer.close()
+        return results, writer.batches, writer.writes
+
+    results, batches, writes = asyncio.run(main())
+    assert results == list(range(20))
+    assert batches == 1
+    assert writes == 20
+    assert stored_items(tmp_path) == list(range(20))
+
+
+def test_failed_write_only_rolls_back_its_own_savepoint(tmp_path):
+    async def main():
+        writer = open_writer(tmp_path)
+        writes = [asyncio.create_task(writer.run(insert, 1)),
+                  asyncio.create_task(writer.run(insert_then_fail, 2)),
+                  asyncio.create_task(writer.run(insert, 3))]
+        await asyncio.sleep(0)
+        writer.start()
+        results = await asyncio.gather(*writes, return_exceptions=True)
+        await writer.close()
+        return results, writer.batches
+
+    results, batches = asyncio.run(main())
+    assert results[0] == 1 and results[2] == 3
+    assert isinstance(results[1], ValueError)
+    assert batches == 1
+    assert stored_items(tmp_path) == [1, 3]
+
+
+def writer_threads() -> int:
+    return sum(1 for thread in threading.enumerate() if thread.name == "ticketbot-sqlite-writer")
+
+
+@pytest.mark.parametrize("failing_step", ["migrations", "read pool"])
+def test_sqlite_connect_can_be_retried(tmp_path, monkeypatch, failing_step):
+    async def main():
+        db = DatabaseManager("sqlite", str(tmp_path / "tickets.db"))
+        engine = db.engine
+        failures = [RuntimeError(f"{failing_step} failed")]
+        if failing_step == "migrations":
+            migrate = schema.migrate_sql
+
+            def flaky(*args):
+                if failures:
+                    raise failures.pop()
+                return migrate(*args)
+            monkeypatch.setattr(schema, "migrate_sql", flaky)
+        else:
+            open_pool = engine.pool.open
+
+            async def flaky():
+                if failures:
+                    raise failures.pop()
+                await open_pool()
+            monkeypatch.setattr(engine.pool, "open", flaky)
+
+        threads = writer_threads()
+        with pytest.raises(RuntimeError):
+            await db.connect()
+        first_connection = engine.writer.connection
+        await db.connect()
+        try:
+            ticket_id = await db.create_ticket(5, guild_id=1)
+            return (writer_threads() - threads, first_connection is engine.writer.connection,
+                    is_closed(first_connection), await db.get_open_tickets(1, 5), ticket_id)
+        finally:
+            await db.close()
+
+    new_threads, same_connection, closed, tickets, ticket_id = asyncio.run(main())
+    assert new_threads == 1
+    assert [ticket["id"] for ticket in tickets] == [ticket_id]
+    # A connection left open by failed migrations is closed and replaced; a started writer is kept
+    if failing_step == "migrations":
+        assert not same_connection and closed
+    else:
+        assert same_connection and not closed
+
+
+def is_closed(connection) -> bool:
+    try:
+        connection.execute("SELECT 1")
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def counted_database(kind: str, tmp_path, monkeypatch) -> DatabaseManager:
+    if kind == "sqlite":
+        return DatabaseManager("sqlite", str(tmp_path / "tickets.db"))
+    mongomock = pytest.importorskip("mongomock")
+    import pymongo
+    monkeypatch.setattr(pymongo, "MongoClient", mongomock.MongoClient)
+    return DatabaseManager("mongodb", "tickets", mongodb_connection_string="mongodb://localhost", mongodb_tls=False)
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "mongodb"])
+def test_counters_follow_every_write(kind, tmp_path, monkeypatch):
+    from databases import CLOSING
+
+    async def main():
+        db = counted_database(kind, tmp_path, monkeypatch)
+        await db.connect()
+        try:
+            await db.create_ticket(5, guild_id=1)
+            missing = await db.create_ticket(5, guild_id=1)
+            await db.set_ticket_status(missing, "channel_missing")
+            deleted = await db.create_ticket(5, guild_id=1)
+            await db.delete_ticket(deleted)
+            closing = await db.create_ticket(5, guild_id=1)
+            await db.set_ticket_status(closing, CLOSING)
+            purged = await db.purge_orphans(1)
+            return purged, await db.get_ticket_stats(1, days=1, user_id=5)
+        finally:
+            await db.close()
+
+    purged, stats = asyncio.run(main())
+    # Only the ticket whose channel is missing was an orphan; the closing one is kept
+    assert purged["tickets"] == 1
+    assert (stats["open_tickets"], stats["created_total"], stats["closed_total"]) == (1, 4, 2)
+    assert [(day["created"], day["closed"]) for day in stats["days"]] == [(4, 2)]
+    assert stats["user"] == {"open_tickets": 1, "created_total": 4}
+
+
+def test_mongodb_counters_share_the_ticket_write_transaction(tmp_path, monkeypatch):
+    db = counted_database("mongodb", tmp_path, monkeypatch)
+    transactions = []
+
+    class Session:
+        """Records the writes run through a transaction; mongomock has no sessions of its own."""
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def with_transaction(self, func):
+            transactions.append(func)
+            return func(None)
+
+    async def main():
+        await db.connect()
+        db.engine.transactions = True
+        monkeypatch.setattr(db.engine.client, "start_session", Session, raising=False)
+        try:
+            ticket_id = await db.create_ticket(5, guild_id=1)
+            await db.delete_ticket(ticket_id)
+            await db.delete_tickets(1)
+            await db.purge_orphans(1)
+            return await db.get_ticket_stats(1)
+        finally:
+            await db.close()
+
+    stats = asyncio.run(main())
+    assert len(transactions) == 4
+    assert (stats["open_tickets"], stats["created_total"], stats["closed_total"]) == (0, 1, 1)
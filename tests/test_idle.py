@@ -0,0 +1,158 @@
+import time
+import asyncio
+from idle import IdleScheduler
+
+GUILD = 1
+
+
+class FakeStore:
+    """The part of :class:`databases.DatabaseManager` the scheduler uses."""
+
+    def __init__(self, tickets: list = (), timeouts: dict = None):
+        self.tickets = list(tickets)
+        self.timeouts = timeouts or {}
+        self.touched = {}
+
+    async def get_idle_timeouts(self) -> dict:
+        return self.timeouts
+
+    async def iter_tickets(self, status=None, fields=()):
+        for ticket in self.tickets:
+            yield ticket
+
+    async def touch_tickets(self, activity):
+        self.touched.update(activity)
+
+
+def scheduler(db=None, timeout: float = 0.3, warning: float = 0.15):
+    """A scheduler with short timeouts that records ``(action, ticket_id, at)`` events."""
+    events = []
+
+    async def warn(ticket, remaining):
+        events.append(("warn", ticket.ticket_id, time.time()))
+
+    async def close(ticket):
+        events.append(("close", ticket.ticket_id, time.time()))
+
+    idle = IdleScheduler(db or FakeStore(), warn, close, lambda ticket: True,
+                         default_timeout=timeout, warning=warning, flush_interval=60)
+    return idle, events
+
+
+async def until(condition, timeout: float = 2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def actions(events: list) -> list:
+    return [action for action, _, _ in events]
+
+
+def test_warns_then_closes():
+    async def main():
+        idle, events = scheduler()
+        started = time.time()
+        idle.track("a", GUILD, 10, started)
+        idle.start()
+        try:
+            await until(lambda: idle.closed)
+        finally:
+            await idle.stop()
+        return started, events, len(idle)
+
+    started, events, tracked = asyncio.run(main())
+    assert actions(events) == ["warn", "close"]
+    assert events[0][2] - started >= 0.15
+    assert events[1][2] - started >= 0.3
+    assert tracked == 0
+
+
+def test_activity_after_the_warning_postpones_the_close():
+    async def main():
+        idle, events = scheduler()
+        idle.track("a", GUILD, 10)
+        idle.start()
+        try:
+            await until(lambda: idle.warned)
+            touched = time.time()
+            idle.touch("a", GUILD, 10, touched)
+            await until(lambda: idle.closed)
+        finally:
+            await idle.stop()
+        return touched, events
+
+    touched, events = asyncio.run(main())
+    assert actions(events) == ["warn", "warn", "close"]
+    # The close comes a full timeout after the activity, and is warned about again
+    assert events[1][2] - touched >= 0.15
+    assert events[2][2] - touched >= 0.3
+
+
+def test_zero_timeout_disables_closing():
+    async def main():
+        idle, events = scheduler()
+        idle.track("a", GUILD, 10)
+        idle.set_timeout(GUILD, 0)
+        idle.start()
+        try:
+            await asyncio.sleep(0.45)
+        finally:
+            await idle.stop()
+        return events, "a" in idle
+
+    events, tracked = asyncio.run(main())
+    assert events == []
+    assert tracked
+
+
+def test_stale_entries_never_fire():
+    async def main():
+        idle, events = scheduler(timeout=0.3, warning=0)
+        started = time.time()
+        idle.track("a", GUILD, 10, started)
+        # Each change leaves the previous deadline behind in the heap
+        idle.set_timeout(GUILD, 0.2)
+        idle.set_timeout(GUILD, 0.5)
+        idle.start()
+        try:
+            await until(lambda: idle.closed)
+            await asyncio.sleep(0.1)
+        finally:
+            await idle.stop()
+        return started, events
+
+    started, events = asyncio.run(main())
+    assert actions(events) == ["close"]
+    assert events[0][2] - started >= 0.5
+
+
+def test_load_rebuilds_the_schedule_from_last_activity():
+    now = time.time()
+    db = FakeStore(tickets=[
+        # Overdue for its warning
+        {"id": "idle", "guild_id": GUILD, "channel_id": 10, "last_activity": now - 45, "created_at": now - 100},
+        {"id": "active", "guild_id": GUILD, "channel_id": 11, "last_activity": now, "created_at": now - 100},
+        {"id": "new", "guild_id": GUILD, "channel_id": 12, "last_activity": None, "created_at": now - 45},
+        # Not this process's guild, and a legacy ticket without a channel
+        {"id": "elsewhere", "guild_id": 2, "channel_id": 13, "last_activity": now - 45, "created_at": now - 100},
+        {"id": "legacy", "guild_id": GUILD, "channel_id": None, "last_activity": now - 45, "created_at": now - 100},
+    ], timeouts={GUILD: 60, 2: 60})
+
+    async def main():
+        idle, events = scheduler(db, timeout=0, warning=30)
+        await idle.load({GUILD})
+        idle.start()
+        try:
+            await until(lambda: idle.warned == 2)
+            await asyncio.sleep(0.1)
+        finally:
+            await idle.stop()
+        return idle, events
+
+    idle, events = asyncio.run(main())
+    assert idle.timeouts == {GUILD: 60}
+    assert len(idle) == 3
+    assert sorted(ticket_id for _, ticket_id, _ in events) == ["idle", "new"]
+    assert idle.closed == 0
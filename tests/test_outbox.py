@@ -0,0 +1,124 @@
+import json
+import asyncio
+import benchmark
+from outbox import Outbox, Deferred
+
+
+def journal(outbox: Outbox) -> dict:
+    """The journaled intents as ``key -> (state, attempts, payload)``."""
+    rows = outbox.connection.execute("SELECT key, state, attempts, payload FROM intents").fetchall()
+    return {key: (state, attempts, json.loads(payload)) for key, state, attempts, payload in rows}
+
+
+def test_submitted_intent_survives_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    applied = []
+
+    async def handler(intent):
+        applied.append((intent.key, intent.payload))
+
+    async def main():
+        outbox = Outbox(path, {"greet": handler})
+        await outbox.open()
+        # Stopped before any worker got to it
+        await outbox.submit("a", "greet", {"user_id": 5})
+        await outbox.close()
+
+        outbox = Outbox(path, {"greet": handler})
+        resumed = await outbox.open()
+        outbox.start()
+        try:
+            await outbox.join()
+            return resumed, journal(outbox)
+        finally:
+            await outbox.close()
+
+    resumed, intents = asyncio.run(main())
+    assert resumed == 1
+    assert applied == [("a", {"user_id": 5})]
+    assert intents["a"][:2] == ("done", 1)
+
+
+def test_duplicate_key_does_nothing(tmp_path):
+    applied = []
+
+    async def handler(intent):
+        applied.append(intent.payload)
+
+    async def main():
+        outbox = Outbox(str(tmp_path / "outbox.db"), {"greet": handler})
+        await outbox.open()
+        outbox.start()
+        try:
+            await outbox.submit("a", "greet", {"attempt": 1})
+            await outbox.join()
+            await outbox.submit("a", "greet", {"attempt": 2})
+            await outbox.join()
+            return outbox.pending, journal(outbox)
+        finally:
+            await outbox.close()
+
+    pending, intents = asyncio.run(main())
+    assert applied == [{"attempt": 1}]
+    assert pending == 0
+    assert intents == {"a": ("done", 1, {"attempt": 1})}
+
+
+def test_intent_is_marked_failed_after_max_attempts(tmp_path):
+    async def broken(intent):
+        raise RuntimeError("database unavailable")
+
+    async def elsewhere(intent):
+        raise Deferred("guild is not served by this process")
+
+    async def main():
+        outbox = Outbox(str(tmp_path / "outbox.db"), {"broken": broken, "elsewhere": elsewhere},
+                        max_attempts=3, retry_delay=0.01)
+        await outbox.open()
+        outbox.start()
+        try:
+            await outbox.submit("a", "broken", {})
+            await outbox.submit("b", "elsewhere", {})
+            await asyncio.wait_for(outbox.join(), 5)
+            return outbox, journal(outbox)
+        finally:
+            await outbox.close()
+
+    outbox, intents = asyncio.run(main())
+    assert outbox.failed == 2
+    assert outbox.retried == 4
+    assert not outbox.is_pending("a") and not outbox.is_pending("b")
+    assert intents["a"][:2] == ("failed", 3)
+    assert intents["b"][:2] == ("failed", 3)
+
+
+def test_retried_ticket_resumes_from_its_checkpoints(running_cog, tmp_path):
+    async def main():
+        async with running_cog(OUTBOX_PATH=tmp_path / "outbox.db") as (cog, guild, user):
+            cog.outbox.retry_delay = 0.01
+            set_ticket_channel = cog.db.set_ticket_channel
+            failures = []
+
+            async def fails_once(*args):
+                if not failures:
+                    failures.append(args)
+                    raise ConnectionError("database unavailable")
+                return await set_ticket_channel(*args)
+            cog.db.set_ticket_channel = fails_once
+
+            interaction = benchmark.FakeInteraction(guild, user, custom_id="support_ticket")
+            await cog.bot.press(interaction)
+            await asyncio.wait_for(cog.outbox.join(), 5)
+            tickets = [ticket async for ticket in cog.db.iter_tickets(fields=("channel_id",))]
+            return cog.outbox, journal(cog.outbox), tickets, guild.text_channels
+
+    outbox, intents, tickets, channels = asyncio.run(main())
+    (state, attempts, payload), = intents.values()
+    channel, = channels
+    ticket, = tickets
+    assert outbox.retried == 1
+    assert (state, attempts) == ("done", 2)
+    assert str(payload["ticket_id"]) == str(ticket["id"])
+    assert payload["channel_id"] == ticket["channel_id"] == channel.id
+    assert payload["welcomed"] is True
+    assert sum("Welcome to your" in (message.content or "") for message in channel.messages) == 1
@@ -0,0 +1,170 @@
+import asyncio
+import benchmark
+
+
+def ticket_channels(cog, guild) -> list:
+    return [channel for channel in guild.text_channels if cog.db.ticket_for_channel(channel.id)]
+
+
+async def press(cog, guild, user, custom_id: str = "support_ticket"):
+    interaction = benchmark.FakeInteraction(guild, user, custom_id=custom_id)
+    await cog.bot.press(interaction)
+    return interaction.messages
+
+
+def test_double_press_opens_one_ticket(running_cog):
+    async def main():
+        async with running_cog() as (cog, guild, user):
+            replies = await asyncio.gather(press(cog, guild, user), press(cog, guild, user))
+            return replies, ticket_channels(cog, guild)
+
+    replies, channels = asyncio.run(main())
+    assert len(channels) == 1
+    assert sorted(replies) == [[f"Ticket created! Please check {channels[0].mention}"],
+                               [f"You already have an open ticket: {channels[0].mention}"]]
+
+
+def test_tickets_are_unlimited_by_default(running_cog, monkeypatch):
+    monkeypatch.delenv("MAX_OPEN_TICKETS_PER_USER", raising=False)
+
+    async def main():
+        async with running_cog() as (cog, guild, user):
+            await press(cog, guild, user)
+            await press(cog, guild, user)
+            await press(cog, guild, user, "bug_report")
+            return ticket_channels(cog, guild)
+
+    assert len(asyncio.run(main())) == 3
+
+
+def test_limit_counts_every_ticket_type(running_cog):
+    async def main():
+        async with running_cog(MAX_OPEN_TICKETS_PER_USER=1) as (cog, guild, user):
+            # Quick presses on different types must not both pass the limit check
+            await asyncio.gather(press(cog, guild, user), press(cog, guild, user, "bug_report"))
+            concurrent = len(ticket_channels(cog, guild))
+            replies = await press(cog, guild, user, "other_ticket")
+            return concurrent, replies, ticket_channels(cog, guild)
+
+    concurrent, replies, channels = asyncio.run(main())
+    assert concurrent == 1
+    assert len(channels) == 1
+    assert replies == [f"You already have an open ticket: {channels[0].mention}"]
+
+
+def test_limit_frees_up_when_a_ticket_closes(running_cog):
+    async def main():
+        async with running_cog(MAX_OPEN_TICKETS_PER_USER=1) as (cog, guild, user):
+            await press(cog, guild, user)
+            channel, = ticket_channels(cog, guild)
+            await benchmark.invoke(cog, cog.close_ticket, benchmark.FakeInteraction(guild, user, channel))
+            await press(cog, guild, user, "bug_report")
+            return channel, ticket_channels(cog, guild)
+
+    closed, channels = asyncio.run(main())
+    assert len(channels) == 1
+    assert channels[0] is not closed
+
+
+def test_reconcile_leaves_tickets_being_opened_alone(running_cog):
+    async def main():
+        async with running_cog() as (cog, guild, user):
+            await cog.get_or_create_ticket_category(guild)
+            # Hold the ticket's channel creation, after its row was written without a channel
+            creating, release = asyncio.Event(), asyncio.Event()
+            create_text_channel = guild.create_text_channel
+
+            async def held(*args, **kwargs):
+                if not creating.is_set():
+                    creating.set()
+                    await release.wait()
+                return await create_text_channel(*args, **kwargs)
+            guild.create_text_channel = held
+
+            opening = asyncio.create_task(press(cog, guild, user))
+            await creating.wait()
+            reconciliation = await cog.reconcile_guild(guild)
+            release.set()
+            await opening
+            return reconciliation, ticket_channels(cog, guild), guild.text_channels
+
+    reconciliation, tickets, channels = asyncio.run(main())
+    assert reconciliation.restore is None
+    assert len(tickets) == 1
+    assert len(channels) == 1
+
+
+async def stored_tickets(cog) -> list:
+    return [ticket async for ticket in cog.db.iter_tickets(fields=("status", "channel_id"))]
+
+
+def test_failed_transcript_keeps_the_ticket_open(running_cog, tmp_path):
+    async def main():
+        async with running_cog(TRANSCRIPT_DIR=tmp_path / "transcripts") as (cog, guild, user):
+            await press(cog, guild, user)
+            channel, = ticket_channels(cog, guild)
+            archive = cog.transcripts.archive
+
+            async def broken(*args):
+                raise OSError("disk full")
+            cog.transcripts.archive = broken
+            await benchmark.invoke(cog, cog.close_ticket, benchmark.FakeInteraction(guild, user, channel))
+            await cog.transcripts.join()
+            kept = await stored_tickets(cog), ticket_channels(cog, guild)
+
+            cog.transcripts.archive = archive
+            await benchmark.invoke(cog, cog.close_ticket, benchmark.FakeInteraction(guild, user, channel))
+            await cog.transcripts.join()
+            return channel, kept, await stored_tickets(cog), guild.text_channels
+
+    channel, (kept_rows, kept_channels), rows, channels = asyncio.run(main())
+    assert kept_rows == [{"id": kept_rows[0]["id"], "status": "open", "channel_id": channel.id}]
+    assert kept_channels == [channel]
+    assert rows == []
+    assert channels == []
+
+
+def test_interrupted_close_resumes_on_start(running_cog, tmp_path):
+    async def main():
+        async with running_cog(TRANSCRIPT_DIR=tmp_path / "transcripts") as (cog, guild, user):
+            await press(cog, guild, user)
+            channel, = ticket_channels(cog, guild)
+            # As if the bot stopped after marking the ticket but before its queued transcript was saved
+            ticket_id = cog.db.ticket_for_channel(channel.id)
+            await cog._begin_close(ticket_id)
+            await cog._resume_closes()
+            await cog.transcripts.join()
+            return await stored_tickets(cog), guild.text_channels, cog.transcripts.archived
+
+    rows, channels, archived = asyncio.run(main())
+    assert rows == []
+    assert channels == []
+    assert archived == 1
+
+
+def test_load_leaves_tickets_being_opened_alone(running_cog, tmp_path):
+    async def main():
+        async with running_cog(OUTBOX_PATH=tmp_path / "outbox.db") as (cog, guild, user):
+            await cog.get_or_create_ticket_category(guild)
+            # Hold the channel creation of the journaled request, after its row was written
+            creating, release = asyncio.Event(), asyncio.Event()
+            create_text_channel = guild.create_text_channel
+
+            async def held(*args, **kwargs):
+                if not creating.is_set():
+                    creating.set()
+                    await release.wait()
+                return await create_text_channel(*args, **kwargs)
+            guild.create_text_channel = held
+
+            await press(cog, guild, user)
+            await creating.wait()
+            await benchmark.invoke(cog, cog.load_tickets, benchmark.FakeInteraction(guild, user))
+            release.set()
+            await asyncio.wait_for(cog.outbox.join(), 5)
+            return cog.restore_jobs[guild.id], ticket_channels(cog, guild), guild.text_channels
+
+    job, tickets, channels = asyncio.run(main())
+    assert (job.created, job.skipped) == (0, 1)
+    assert len(tickets) == 1
+    assert len(channels) == 1
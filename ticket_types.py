@@ -0,0 +1,200 @@
+import re
+from typing import Optional
+import nextcord
+
+# Ticket type names and channel prefixes: lowercase, usable in a channel name
+NAME_PATTERN = re.compile(r"^[a-z0-9_]{1,32}$")
+
+# A panel is one message, which holds at most 5 rows of 5 buttons
+MAX_TYPES_PER_GUILD = 25
+
+# Custom IDs of the buttons posted before ticket types were configurable; the
+# built-in types keep them, so panels already in channels keep working
+LEGACY_CUSTOM_IDS = {"support": "support_ticket", "bug": "bug_report", "other": "other_ticket"}
+
+# Channel prefixes of tickets opened by earlier versions, or recreated by /load
+LEGACY_PREFIXES = ("support", "bug", "inquiry", "ticket")
+
+# Type of tickets created before tickets recorded one
+DEFAULT_TYPE = "support"
+
+
+class TicketType:
+    """One kind of ticket a guild offers: its button, channel name and where the channel goes."""
+    __slots__ = ("guild_id", "name", "label", "prefix", "emoji", "category_id", "staff_role_ids", "max_open",
+                 "position")
+
+    def __init__(self, guild_id: Optional[int], name: str, label: str, prefix: str, emoji: str = "🎫",
+                 category_id: Optional[int] = None, staff_role_ids: tuple = (), max_open: Optional[int] = None,
+                 position: int = 0):
+        self.guild_id = guild_id
+        self.name = name
+        self.label = label
+        self.prefix = prefix
+        self.emoji = emoji
+        # None puts the channel in the guild's ticket category
+        self.category_id = category_id
+        # Roles that can see and answer tickets of this type
+        self.staff_role_ids = tuple(staff_role_ids)
+        # Open tickets of this type per user, on top of MAX_OPEN_TICKETS_PER_USER; None for no limit
+        self.max_open = max_open
+        self.position = position
+
+    @property
+    def custom_id(self) -> str:
+        return LEGACY_CUSTOM_IDS.get(self.name, f"ticket_type:{self.name}")
+
+    @classmethod
+    def from_dict(cls, row: dict) -> "TicketType":
+        return cls(**{field: row.get(field) for field in cls.__slots__ if row.get(field) is not None})
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def copy(self, **changes) -> "TicketType":
+        return TicketType(**{**self.to_dict(), **changes})
+
+
+# What a guild offers until it configures its own types
+DEFAULT_TICKET_TYPES = (
+    TicketType(None, "support", "Support", "support", "🎫", position=0),
+    TicketType(None, "bug", "Bug Report", "bug", "🐛", position=1),
+    TicketType(None, "other", "Other", "inquiry", "❓", position=2),
+)
+
+
+class TicketPanel(nextcord.ui.View):
+    """Persistent view with one button per ticket type.
+
+    Every button calls ``on_press(interaction, custom_id)``; the ticket type
+    is looked up in the routing table when the button is pressed, so a
+    panel keeps following its guild's configuration after it is posted.
+    """
+
+    def __init__(self, ticket_types, on_press):
+        super().__init__(timeout=None)
+        self.on_press = on_press
+        for ticket_type in ticket_types:
+            self._add_button(ticket_type.custom_id, ticket_type.label, ticket_type.emoji)
+
+    @classmethod
+    def routing(cls, custom_ids, on_press) -> "TicketPanel":
+        """A view that is only registered, never posted, to route presses of ``custom_ids`` on any panel."""
+        panel = cls((), on_press)
+        for custom_id in custom_ids:
+            panel._add_button(custom_id, custom_id)
+        return panel
+
+    def _add_button(self, custom_id: str, label: str, emoji: str = None):
+        button = nextcord.ui.Button(style=nextcord.ButtonStyle.primary, label=label, emoji=emoji, custom_id=custom_id)
+
+        async def callback(interaction: nextcord.Interaction):
+            await self.on_press(interaction, custom_id)
+        button.callback = callback
+        self.add_item(button)
+
+
+class TicketTypeRegistry:
+    """Every guild's ticket types, compiled into one in-memory routing table.
+
+    All types are read once at startup. Routing a button press is then a
+    single lookup of ``(guild_id, custom_id)`` and never touches the
+    database. Changes write through to the database and recompile only the
+    changed guild. A guild is served by exactly one process, so this keeps
+    the table current without polling.
+
+    Guilds without types of their own use :data:`DEFAULT_TICKET_TYPES`.
+    Their first change copies the defaults, so the defaults can then be
+    edited or removed like any other type.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._types = {}
+        self._routes = {}
+        self._prefixes = {}
+        self._default_routes = {ticket_type.custom_id: ticket_type for ticket_type in DEFAULT_TICKET_TYPES}
+        self._default_prefixes = tuple(f"{prefix}-" for prefix in LEGACY_PREFIXES)
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    @property
+    def custom_ids(self) -> set:
+        """Custom IDs of every button that can route to a ticket type."""
+        return {custom_id for _, custom_id in self._routes} | set(self._default_routes)
+
+    def types_for(self, guild_id: int) -> tuple:
+        """A guild's ticket types in panel order."""
+        return self._types.get(guild_id, DEFAULT_TICKET_TYPES)
+
+    def get(self, guild_id: int, name: str) -> Optional[TicketType]:
+        return next((ticket_type for ticket_type in self.types_for(guild_id) if ticket_type.name == name), None)
+
+    def route(self, guild_id: int, custom_id: str) -> Optional[TicketType]:
+        """The ticket type a button press opens, or None if the guild no longer has it."""
+        if guild_id in self._types:
+            return self._routes.get((guild_id, custom_id))
+        return self._default_routes.get(custom_id)
+
+    def channel_prefixes(self, guild_id: int) -> tuple:
+        """Channel name prefixes, with the trailing dash, of a guild's ticket channels."""
+        return self._prefixes.get(guild_id, self._default_prefixes)
+
+    def _compile(self, guild_id: int, ticket_types: list):
+        for key in [key for key in self._routes if key[0] == guild_id]:
+            del self._routes[key]
+        if not ticket_types:
+            self._types.pop(guild_id, None)
+            self._prefixes.pop(guild_id, None)
+            return
+
+        ticket_types = tuple(sorted(ticket_types, key=lambda ticket_type: (ticket_type.position, ticket_type.name)))
+        self._types[guild_id] = ticket_types
+        for ticket_type in ticket_types:
+            self._routes[(guild_id, ticket_type.custom_id)] = ticket_type
+        prefixes = dict.fromkeys(ticket_type.prefix for ticket_type in ticket_types)
+        prefixes.update(dict.fromkeys(LEGACY_PREFIXES))
+        self._prefixes[guild_id] = tuple(f"{prefix}-" for prefix in prefixes)
+
+    async def load(self, guild_ids: set):
+        """Compile the ticket types of ``guild_ids`` from the database."""
+        by_guild = {}
+        for row in await self.db.get_ticket_types():
+            if row["guild_id"] in guild_ids:
+                by_guild.setdefault(row["guild_id"], []).append(TicketType.from_dict(row))
+        for guild_id, ticket_types in by_guild.items():
+            self._compile(guild_id, ticket_types)
+
+    async def save(self, ticket_type: TicketType):
+        """Add or replace one of a guild's types; a new type goes after the existing ones."""
+        current = list(self.types_for(ticket_type.guild_id))
+        existing = next((other for other in current if other.name == ticket_type.name), None)
+        if existing is not None:
+            ticket_type.position = existing.position
+            current.remove(existing)
+        else:
+            ticket_type.position = max((other.position for other in current), default=-1) + 1
+
+        if ticket_type.guild_id in self._types:
+            changed = [ticket_type]
+        else:
+            # Copy the defaults, which only existed in memory until now
+            changed = [other.copy(guild_id=ticket_type.guild_id) for other in current] + [ticket_type]
+        await self.db.save_ticket_types(ticket_type.guild_id, [other.to_dict() for other in changed])
+        self._compile(ticket_type.guild_id, [other.copy(guild_id=ticket_type.guild_id) for other in current]
+                      + [ticket_type])
+
+    async def remove(self, guild_id: int, name: str) -> bool:
+        """Remove one of a guild's types; returns False if the guild doesn't have it."""
+        current = list(self.types_for(guild_id))
+        remaining = [ticket_type.copy(guild_id=guild_id) for ticket_type in current if ticket_type.name != name]
+        if len(remaining) == len(current):
+            return False
+
+        if guild_id in self._types:
+            await self.db.delete_ticket_type(guild_id, name)
+        else:
+            await self.db.save_ticket_types(guild_id, [ticket_type.to_dict() for ticket_type in remaining])
+        self._compile(guild_id, remaining)
+        return True
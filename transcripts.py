@@ -0,0 +1,186 @@
+import os
+import gzip
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import nextcord
+import metrics
+from concurrency import RouteRateLimiter
+
+# Messages fetched per history request; 100 is Discord's maximum
+PAGE_SIZE = 100
+
+
+class _ArchiveFile:
+    """A gzip-compressed JSONL file written under a temporary name until committed.
+
+    Every method blocks and is meant to run in a worker thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.partial_path = path + ".part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = gzip.open(self.partial_path, "wt", encoding="utf-8")
+
+    def write(self, records: list):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str))
+            self._file.write("\n")
+
+    def commit(self) -> int:
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+        return os.path.getsize(self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.partial_path)
+        except OSError:
+            pass
+
+
+def _message_record(message: nextcord.Message) -> dict:
+    return {
+        "type": "message",
+        "id": message.id,
+        "author_id": message.author.id,
+        "author": str(message.author),
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "content": message.content,
+        "attachments": [attachment.url for attachment in message.attachments],
+        "embeds": [embed.to_dict() for embed in message.embeds]
+    }
+
+
+class TranscriptArchiver:
+    """Archives closed ticket channels in the background.
+
+    Closing a ticket only queues the channel. A few workers stream its
+    history oldest first, one page at a time, into a gzip-compressed JSONL
+    file; compression and disk writes run in a thread pool, so neither the
+    event loop nor memory grows with the size of the channel. Once the file
+    is complete its path is recorded in the database and the job's follow-up
+    (deleting the channel) runs. If archiving fails the channel is kept.
+
+    The queue is bounded: when it is full, :meth:`submit` waits, which
+    slows down closes instead of buffering an unbounded backlog.
+    """
+
+    def __init__(self, db, rate_limiter: RouteRateLimiter, directory: str,
+                 workers: int = 2, queue_size: int = 100):
+        self.db = db
+        self.rate_limiter = rate_limiter
+        self.directory = directory
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ticketbot-transcripts")
+        self._tasks = []
+
+        self.archived = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @property
+    def pending(self) -> int:
+        """Jobs waiting in the queue."""
+        return self._queue.qsize()
+
+    def start(self):
+        if self.enabled and not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, ticket_id, channel: nextcord.TextChannel, then=None, failed=None):
+        """Queue ``channel`` for archiving; ``then()`` is awaited once the transcript is saved, ``failed()`` if not."""
+        await self._queue.put((str(ticket_id), channel, then, failed))
+
+    async def join(self):
+        """Wait until every queued transcript has been handled."""
+        await self._queue.join()
+
+    def path_for(self, guild_id: int, ticket_id: str, channel_id: int) -> str:
+        return os.path.join(self.directory, str(guild_id), f"{ticket_id}-{channel_id}.jsonl.gz")
+
+    async def _work(self):
+        while True:
+            ticket_id, channel, then, failed = await self._queue.get()
+            try:
+                started = time.perf_counter()
+                await self.archive(ticket_id, channel)
+                metrics.TRANSCRIPT_SECONDS.observe(time.perf_counter() - started)
+                self.archived += 1
+            except Exception as e:
+                self.failed += 1
+                metrics.log(f"Failed to archive the transcript of ticket {ticket_id}: {str(e)}", level="error",
+                            channel_id=channel.id)
+                try:
+                    await channel.send("⚠️ The transcript of this ticket could not be saved, so the channel was kept.")
+                except nextcord.HTTPException:
+                    pass
+                if failed is not None:
+                    try:
+                        await failed()
+                    except Exception as e:
+                        metrics.log(f"Failed to keep ticket {ticket_id} after its transcript failed: {str(e)}",
+                                    level="error")
+            else:
+                if then is not None:
+                    try:
+                        await then()
+                    except Exception as e:
+                        metrics.log(f"Failed to finish closing ticket {ticket_id}: {str(e)}", level="error")
+            finally:
+                self._queue.task_done()
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def archive(self, ticket_id: str, channel: nextcord.TextChannel) -> dict:
+        """Stream ``channel``'s history to a new archive file and record it; returns the record."""
+        guild_id = channel.guild.id
+        path = self.path_for(guild_id, ticket_id, channel.id)
+        archive = await self._in_thread(_ArchiveFile, path)
+        count = 0
+        try:
+            await self._in_thread(archive.write, [{
+                "type": "ticket",
+                "ticket_id": ticket_id,
+                "guild_id": guild_id,
+                "channel_id": channel.id,
+                "channel_name": channel.name,
+                "archived_at": int(time.time())
+            }])
+
+            after = None
+            while True:
+                await self.rate_limiter.acquire("read_history", channel.id)
+                page = [
+                    _message_record(message)
+                    async for message in channel.history(limit=PAGE_SIZE, after=after, oldest_first=True)
+                ]
+                if page:
+                    await self._in_thread(archive.write, page)
+                    count += len(page)
+                    after = nextcord.Object(id=page[-1]["id"])
+                if len(page) < PAGE_SIZE:
+                    break
+
+            size = await self._in_thread(archive.commit)
+        except BaseException:
+            await self._in_thread(archive.abort)
+            raise
+
+        await self.db.save_transcript(ticket_id, guild_id, channel.id, path, count, size)
+        return {"path": path, "message_count": count, "size_bytes": size}